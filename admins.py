@@ -0,0 +1,50 @@
+import logging
+import time
+from collections import OrderedDict
+
+from telegram import ChatMember
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = (ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+
+
+class AdminCache:
+    """Admin lists of group chats, fetched in bulk and kept for `ttl` seconds.
+
+    Looking up a (chat, user) pair answers from the cached admin set of the
+    chat, so one get_chat_administrators call serves every admin command in
+    that chat until the entry expires or is invalidated. At most `max_chats`
+    chats are kept, least recently used first out.
+    """
+
+    def __init__(self, ttl: float = 600, max_chats: int = 1000):
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self._chats = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def is_admin(self, bot, chat_id, user_id: int) -> bool:
+        entry = self._chats.get(chat_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._chats.move_to_end(chat_id)
+            self.hits += 1
+            return user_id in entry[1]
+
+        self.misses += 1
+        members = await bot.get_chat_administrators(chat_id)
+        admin_ids = frozenset(member.user.id for member in members if member.status in ADMIN_STATUSES)
+        self._chats[chat_id] = (time.monotonic() + self.ttl, admin_ids)
+        self._chats.move_to_end(chat_id)
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+        logger.info(f"Cached {len(admin_ids)} admins of chat {chat_id}")
+        return user_id in admin_ids
+
+    def invalidate(self, chat_id) -> None:
+        if self._chats.pop(chat_id, None) is not None:
+            logger.info(f"Admin cache of chat {chat_id} invalidated")
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "chats": len(self._chats)}
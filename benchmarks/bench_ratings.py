@@ -0,0 +1,58 @@
+"""Incremental Elo updates and full season replays of ratings.RatingBook.
+
+Run from the repository root: python benchmarks/bench_ratings.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratings import RatingBook  # noqa: E402
+
+PLAYER_POOL = 80
+TEAM_COUNT = 3
+TEAM_SIZE = 5
+
+
+def history(match_count, rng):
+    pool = [f"p{i}" for i in range(PLAYER_POOL)]
+    week = 7 * 24 * 3600
+    for i in range(match_count):
+        players = rng.sample(pool, TEAM_COUNT * TEAM_SIZE)
+        teams = [players[t * TEAM_SIZE:(t + 1) * TEAM_SIZE] for t in range(TEAM_COUNT)]
+        winner = rng.choice([None, 0, 1, 2])
+        absent = rng.sample(players, rng.randint(0, 2))
+        yield teams, winner, absent, 1_600_000_000 + i * week / 2
+
+
+def main():
+    rng = random.Random(7)
+    for match_count in (100, 1_000, 10_000):
+        book = RatingBook()
+        records = []
+        started = time.perf_counter()
+        for teams, winner, absent, played_at in history(match_count, rng):
+            record = book.compute(teams, winner, absent, played_at)
+            book.apply(record)
+            records.append(record)
+        incremental = time.perf_counter() - started
+
+        started = time.perf_counter()
+        book.replay(records)
+        replay = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(100_000):
+            stats = book.stats("p1")
+            stats.attendance_rate, stats.win_rate
+        lookup = (time.perf_counter() - started) / 100_000
+
+        print(f"{match_count:>6} games: "
+              f"{incremental / match_count * 1e6:6.1f} us per result, "
+              f"replay {replay * 1000:7.1f} ms, stats lookup {lookup * 1e9:5.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
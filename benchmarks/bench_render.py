@@ -0,0 +1,73 @@
+"""Roster rendering: the old string concatenation against roster.RosterRenderer.
+
+Run from the repository root: python benchmarks/bench_render.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from roster import Roster, RosterRenderer  # noqa: E402
+
+APPROVE_EMOJI = "✅"
+BALL_EMOJI = "⚽"
+HEADER = "Game scheduled for: Sunday 18:00\n\n"
+
+
+def concatenate(playing_list, waiting_list, approvals, bringing_ball):
+    # print_list_to_group before the renderer existed
+    message = HEADER
+    message += "Playing List:\n"
+    for i, player in enumerate(playing_list, 1):
+        approval_status = f"{APPROVE_EMOJI}" if approvals.get(player, False) else ""
+        ball_status = f"{BALL_EMOJI}" if player in bringing_ball else ""
+        message += f"{i}. @{player} {approval_status}{ball_status}\n"
+    message += "\nWaiting List:\n"
+    for i, player in enumerate(waiting_list, 1):
+        message += f"{i}. @{player}\n"
+    return message
+
+
+def main():
+    print(f"{'entries':>7} {'concat us':>10} {'cold us':>8} {'1 change us':>12} {'cached us':>10}")
+    for size in (15, 100, 1000):
+        max_players = min(size, 15) if size == 15 else size * 3 // 4
+        roster = Roster(max_players)
+        names = [f"player_{i}" for i in range(size)]
+        for name in names:
+            roster.add(name)
+        for name in names[::3]:
+            roster.approve(name)
+        for name in names[::7]:
+            roster.toggle_ball(name)
+        playing_list, waiting_list = roster.playing_names(), roster.waiting_names()
+        approvals = {name: True for name in names[::3] if name in roster.playing}
+        bringing_ball = {name for name in names[::7] if name in roster.playing}
+        assert concatenate(playing_list, waiting_list, approvals, bringing_ball) == RosterRenderer(
+            roster, APPROVE_EMOJI, BALL_EMOJI).render(HEADER)
+
+        number = max(20, 20000 // size)
+        concat = timeit.timeit(lambda: concatenate(playing_list, waiting_list, approvals, bringing_ball),
+                               number=number) / number
+
+        def cold():
+            RosterRenderer(roster, APPROVE_EMOJI, BALL_EMOJI).render(HEADER)
+        cold_time = timeit.timeit(cold, number=number) / number
+
+        renderer = RosterRenderer(roster, APPROVE_EMOJI, BALL_EMOJI)
+        renderer.render(HEADER)
+        target = playing_list[len(playing_list) // 2]
+
+        def one_change():
+            roster.toggle_ball(target)
+            renderer.render(HEADER)
+        change_time = timeit.timeit(one_change, number=number) / number
+        cached_time = timeit.timeit(lambda: renderer.render(HEADER), number=number * 10) / (number * 10)
+
+        print(f"{size:>7} {concat * 1e6:>10.1f} {cold_time * 1e6:>8.1f} {change_time * 1e6:>12.1f} "
+              f"{cached_time * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Solve time and balance quality of teams.balance_teams.
+
+Run from the repository root: python benchmarks/bench_teams.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teams import balance_teams, team_sizes  # noqa: E402
+
+CASES = [(15, 3), (30, 3), (60, 6), (120, 8)]
+RUNS = 20
+
+
+def shuffled_spread(players, ratings, team_count, rng):
+    # What divide_teams used to do: shuffle and slice
+    players = players[:]
+    rng.shuffle(players)
+    averages, start = [], 0
+    for size in team_sizes(len(players), team_count):
+        team = players[start:start + size]
+        averages.append(sum(ratings[p] for p in team) / size)
+        start += size
+    return max(averages) - min(averages)
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'players':>7} {'teams':>5} {'budget ms':>9} {'p50 ms':>7} {'max ms':>7} "
+          f"{'spread':>7} {'shuffle':>8} {'broken':>6}")
+    for player_count, team_count in CASES:
+        for budget in (0.005, 0.05):
+            times, spreads, shuffles, broken = [], [], [], 0
+            for _ in range(RUNS):
+                players = [f"p{i}" for i in range(player_count)]
+                ratings = {p: rng.gauss(1000, 150) for p in players}
+                balls = rng.sample(players, team_count)
+                pairs = [tuple(rng.sample(players, 2)) for _ in range(player_count // 10)]
+                started = time.perf_counter()
+                split = balance_teams(players, ratings, team_count, ball_bringers=balls,
+                                      together=pairs[::2], apart=pairs[1::2], time_budget=budget,
+                                      seed=rng.random())
+                times.append((time.perf_counter() - started) * 1000)
+                spreads.append(split.spread)
+                shuffles.append(shuffled_spread(players, ratings, team_count, rng))
+                broken += split.violations
+            print(f"{player_count:>7} {team_count:>5} {budget * 1000:>9.0f} {statistics.median(times):>7.2f} "
+                  f"{max(times):>7.2f} {statistics.mean(spreads):>7.2f} {statistics.mean(shuffles):>8.2f} "
+                  f"{broken:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Load test of the whole bot against a fake Telegram Bot API; no token or network needed.
+
+Starts a local stand-in for the Bot API, runs soccer_bot.main() against it in
+polling mode and replays synthetic traffic: every user sends /register at a
+random moment within the test window, and most follow up with /approve,
+/print_list or /remove. With --buttons, joining, approving and leaving are
+taps on the roster message's inline keyboard instead. Reports throughput,
+reply latency and the outgoing API calls.
+
+Run from the repository root: python benchmarks/loadtest.py [--users 500] [--seconds 10] [--buttons]
+
+Replies go through the outbox with Telegram's real rate limits unless
+--global-rate is raised, so by default the latency includes queueing.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from itertools import count
+from typing import Deque, Dict, List
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webserver import HTTPServer, Request, Response  # noqa: E402
+
+TOKEN = "123456:loadtest"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "SoccerBot", "username": "soccer_load_test_bot"}
+GROUP_CHAT_ID = -1001
+ADMIN_ID = 1
+FIRST_USER_ID = 10_000
+GAME_KEY = f"{GROUP_CHAT_ID}:1"
+BUTTONS = {"/register": "join", "/approve": "approve", "/remove": "leave"}
+
+METHODS = ("getMe", "setMyCommands", "deleteWebhook", "getUpdates", "sendMessage", "editMessageText",
+           "pinChatMessage", "getChatAdministrators", "getChatMember", "answerCallbackQuery", "close")
+
+
+class FakeBotAPI:
+    """Just enough of the Bot API for soccer_bot, with updates fed from a local queue."""
+
+    def __init__(self):
+        self.server = HTTPServer("127.0.0.1", 0)
+        for method in METHODS:
+            self.server.route("POST", f"/bot{TOKEN}/{method}", self._handler(method))
+        self.updates: Deque[dict] = deque()
+        self.update_ids = count(1)
+        self.message_ids = count(1)
+        self.new_updates = asyncio.Event()
+        self.polling = asyncio.Event()
+        self.calls = Counter()
+        self.messages = Counter()
+        # Times commands were sent, per chat, until the bot answers them
+        self.waiting: Dict[int, Deque[float]] = {}
+        self.latencies: List[float] = []
+        self.last_reply = 0.0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.port}"
+
+    @property
+    def unanswered(self) -> int:
+        return sum(len(times) for times in self.waiting.values())
+
+    def _handler(self, method: str):
+        async def handle(request: Request) -> Response:
+            self.calls[method] += 1
+            params = {}
+            for name, values in parse_qs(request.body.decode()).items():
+                try:
+                    params[name] = json.loads(values[0])
+                except ValueError:
+                    params[name] = values[0]
+            result = await getattr(self, method, self.default)(params)
+            return Response.json({"ok": True, "result": result})
+        return handle
+
+    def push_command(self, user_id: int, text: str, chat_id: int = None) -> None:
+        chat_id = chat_id or user_id
+        chat = {"id": chat_id, "type": "private"} if chat_id > 0 else {"id": chat_id, "type": "supergroup", "title": "Football"}
+        command = text.split()[0]
+        self.updates.append({
+            "update_id": next(self.update_ids),
+            "message": {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": chat,
+                "from": {"id": user_id, "is_bot": False, "first_name": f"Player{user_id}", "username": f"player{user_id}"},
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+            },
+        })
+        self.waiting.setdefault(chat_id, deque()).append(time.perf_counter())
+        self.new_updates.set()
+
+    def push_tap(self, user_id: int, data: str) -> None:
+        query_id = str(next(self.update_ids))
+        self.updates.append({
+            "update_id": int(query_id),
+            "callback_query": {
+                "id": query_id,
+                "from": {"id": user_id, "is_bot": False, "first_name": f"Player{user_id}", "username": f"player{user_id}"},
+                "chat_instance": "1",
+                "data": data,
+            },
+        })
+        self.waiting.setdefault(query_id, deque()).append(time.perf_counter())
+        self.new_updates.set()
+
+    async def default(self, params: dict):
+        return True
+
+    async def getMe(self, params: dict):
+        return BOT_USER
+
+    async def deleteWebhook(self, params: dict):
+        if params.get("drop_pending_updates"):
+            self.updates.clear()
+        return True
+
+    async def getUpdates(self, params: dict):
+        self.polling.set()
+        offset = params.get("offset") or 0
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), timeout=min(float(params.get("timeout") or 0), 1.0))
+            except asyncio.TimeoutError:
+                pass
+        return [update for update, _ in zip(self.updates, range(int(params.get("limit") or 100)))]
+
+    def _message(self, params: dict) -> dict:
+        chat_id = int(params["chat_id"])
+        chat = {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}
+        return {"message_id": next(self.message_ids), "date": int(time.time()), "chat": chat, "text": params.get("text", "")}
+
+    async def sendMessage(self, params: dict):
+        chat_id = int(params["chat_id"])
+        self.messages["private" if chat_id > 0 else "group"] += 1
+        waiting = self.waiting.get(chat_id)
+        if waiting:
+            self.latencies.append(time.perf_counter() - waiting.popleft())
+            self.last_reply = time.perf_counter()
+        return self._message(params)
+
+    async def answerCallbackQuery(self, params: dict):
+        waiting = self.waiting.get(str(params["callback_query_id"]))
+        if waiting:
+            self.latencies.append(time.perf_counter() - waiting.popleft())
+            self.last_reply = time.perf_counter()
+        return True
+
+    async def editMessageText(self, params: dict):
+        return self._message(params)
+
+    async def getChatAdministrators(self, params: dict):
+        return [{"status": "creator", "is_anonymous": False, "user": {"id": ADMIN_ID, "is_bot": False, "first_name": "Admin"}}]
+
+    async def getChatMember(self, params: dict):
+        status = "creator" if int(params["user_id"]) == ADMIN_ID else "member"
+        return {"status": status, "user": {"id": int(params["user_id"]), "is_bot": False, "first_name": "User"}}
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+async def replay(api: FakeBotAPI, users: int, seconds: float, rng: random.Random, buttons: bool) -> int:
+    events = []
+    for user in range(users):
+        user_id = FIRST_USER_ID + user
+        at = rng.uniform(0, seconds)
+        events.append((at, user_id, "/register"))
+        follow_up = rng.choices(["/approve", "/print_list", "/remove", None], weights=[50, 25, 10, 15])[0]
+        if follow_up:
+            events.append((rng.uniform(at, seconds), user_id, follow_up))
+    events.sort()
+    started = time.perf_counter()
+    for at, user_id, text in events:
+        delay = started + at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if buttons and text in BUTTONS:
+            api.push_tap(user_id, f"{BUTTONS[text]}:{GAME_KEY}")
+        else:
+            api.push_command(user_id, text)
+    return len(events)
+
+
+async def run(args) -> None:
+    api = FakeBotAPI()
+    await api.server.start()
+    state_dir = tempfile.mkdtemp(prefix="soccerbot-loadtest-")
+    os.environ.update({
+        "BOT_TOKEN": TOKEN,
+        "BOT_API_URL": api.url,
+        "BOT_MODE": "polling",
+        "GROUP_CHAT_ID": str(GROUP_CHAT_ID),
+        "STATE_DB_PATH": os.path.join(state_dir, "state.db"),
+        "OUTBOX_GLOBAL_RATE": str(args.global_rate),
+        "CONCURRENT_UPDATES": str(args.concurrent_updates),
+        "METRICS_LOG_INTERVAL": "0",
+    })
+    soccer_bot = importlib.import_module("soccer_bot")
+    logging.getLogger().setLevel(logging.WARNING)
+
+    stop_event = asyncio.Event()
+    bot_task = asyncio.create_task(soccer_bot.main(stop_event))
+    await asyncio.wait_for(api.polling.wait(), timeout=30)
+
+    api.push_command(ADMIN_ID, "/create_game Sunday 18:00", GROUP_CHAT_ID)
+    while api.unanswered:
+        await asyncio.sleep(0.01)
+    api.latencies.clear()
+    api.calls.clear()
+    api.messages.clear()
+
+    print(f"Replaying {args.users} users over {args.seconds:g} s against {api.url} ...")
+    started = time.perf_counter()
+    sent = await replay(api, args.users, args.seconds, random.Random(args.seed), args.buttons)
+    deadline = time.perf_counter() + args.drain
+    while api.unanswered and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = (api.last_reply or time.perf_counter()) - started
+
+    stop_event.set()
+    await bot_task
+    await api.server.stop()
+
+    answered = len(api.latencies)
+    print(f"Updates sent:      {sent}")
+    print(f"Answered:          {answered} ({api.unanswered} unanswered)")
+    print(f"Elapsed:           {elapsed:.2f} s")
+    print(f"Throughput:        {answered / elapsed if elapsed else 0:.1f} replies/s")
+    print(f"Reply latency:     p50 {percentile(api.latencies, 0.5) * 1000:.1f} ms, "
+          f"p99 {percentile(api.latencies, 0.99) * 1000:.1f} ms, max {max(api.latencies, default=0) * 1000:.1f} ms")
+    print(f"Messages sent:     {api.messages['private']} private, {api.messages['group']} group, "
+          f"{api.calls['answerCallbackQuery']} button answers")
+    print("API calls:         " + ", ".join(f"{method} {calls}" for method, calls in api.calls.most_common()))
+    print("Handler metrics:")
+    print(soccer_bot.metrics.summary())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=10, help="window in which the users send their commands")
+    parser.add_argument("--global-rate", type=float, default=30, help="outbox messages per second (Telegram allows ~30)")
+    parser.add_argument("--buttons", action="store_true", help="join, approve and leave with the inline keyboard")
+    parser.add_argument("--concurrent-updates", type=int, default=1)
+    parser.add_argument("--drain", type=float, default=120, help="seconds to wait for outstanding replies")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
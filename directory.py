@@ -0,0 +1,106 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+USER_KEY_PREFIX = "user:"
+
+
+class UserRecord:
+    __slots__ = ("user_id", "username", "first_name", "seen", "saved_seen")
+
+    def __init__(self, user_id: int, username: Optional[str], first_name: str, seen: float = 0):
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        # UNIX time the user was last seen, to restore the LRU order, and the value last saved
+        self.seen = seen
+        self.saved_seen = seen
+
+    @property
+    def player_name(self) -> str:
+        # Same name the commands register the user under
+        return self.username or f"{self.first_name}_{self.user_id}"
+
+    def to_dict(self) -> dict:
+        return {"user_id": self.user_id, "username": self.username, "first_name": self.first_name, "seen": self.seen}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UserRecord":
+        return cls(data["user_id"], data.get("username"), data.get("first_name", ""), data.get("seen", 0))
+
+
+class UserDirectory:
+    """Latest username and first name of the users the bot has seen, by user ID and by username.
+
+    Fed from every incoming update, so players an admin registered by username
+    can be linked to their user ID without a get_chat_member call. Both lookups
+    are dict hits. At most `max_users` users are kept, least recently seen first
+    out. A record is written to the store when it changes, and otherwise at most
+    every `seen_resolution` seconds to keep the saved LRU order close.
+    """
+
+    def __init__(self, store, max_users: int = 10000, seen_resolution: float = 3600):
+        self.store = store
+        self.max_users = max_users
+        self.seen_resolution = seen_resolution
+        self._by_id: "OrderedDict[int, UserRecord]" = OrderedDict()
+        # Lowercase username -> user ID; Telegram usernames are case-insensitive
+        self._by_username: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def get(self, user_id: int) -> Optional[UserRecord]:
+        return self._by_id.get(user_id)
+
+    def find(self, username: str) -> Optional[UserRecord]:
+        user_id = self._by_username.get(username.lstrip('@').lower())
+        return self._by_id.get(user_id) if user_id is not None else None
+
+    def observe(self, user_id: int, username: Optional[str], first_name: str) -> Optional[str]:
+        """Record a user seen in an update.
+
+        Returns the player name they had before if it changed, e.g. after they
+        picked a new username, so rosters can follow the rename.
+        """
+        now = time.time()
+        record = self._by_id.get(user_id)
+        if record is not None:
+            self._by_id.move_to_end(user_id)
+            record.seen = now
+            if record.username == username and record.first_name == first_name:
+                if now - record.saved_seen >= self.seen_resolution:
+                    self._save(record)
+                return None
+            previous = record.player_name
+            if record.username and self._by_username.get(record.username.lower()) == user_id:
+                del self._by_username[record.username.lower()]
+            record.username, record.first_name = username, first_name
+        else:
+            previous = None
+            record = self._by_id[user_id] = UserRecord(user_id, username, first_name)
+            while len(self._by_id) > self.max_users:
+                _, evicted = self._by_id.popitem(last=False)
+                if evicted.username and self._by_username.get(evicted.username.lower()) == evicted.user_id:
+                    del self._by_username[evicted.username.lower()]
+                self.store.delete(f"{USER_KEY_PREFIX}{evicted.user_id}")
+        if username:
+            self._by_username[username.lower()] = user_id
+        record.seen = now
+        self._save(record)
+        return previous if previous != record.player_name else None
+
+    def _save(self, record: UserRecord) -> None:
+        record.saved_seen = record.seen
+        self.store.save(f"{USER_KEY_PREFIX}{record.user_id}", record.to_dict())
+
+    def load(self) -> None:
+        records = [UserRecord.from_dict(data) for data in self.store.load_prefix(USER_KEY_PREFIX).values()]
+        for record in sorted(records, key=lambda record: record.seen)[-self.max_users:]:
+            self._by_id[record.user_id] = record
+            if record.username:
+                self._by_username[record.username.lower()] = record.user_id
+        logger.info(f"Loaded {len(self._by_id)} known users")
@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import re
+from datetime import date, datetime, time, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from roster import Roster
+
+logger = logging.getLogger(__name__)
+
+GAME_KEY_PREFIX = "game:"
+# Highest game ID handed out per chat, so IDs of cleared games are never reused
+LAST_GAME_ID_PREFIX = "last_game_id:"
+GAME_KEY_PATTERN = re.compile(r"^(-?\d+)[:_](\d+)$")
+
+
+def game_key(chat_id: int, game_id: int) -> str:
+    return f"{chat_id}:{game_id}"
+
+
+def parse_game_key(text: str) -> Optional[str]:
+    """Accept `chat:game` as well as the `chat_game` form used in deep links."""
+    match = GAME_KEY_PATTERN.match(text)
+    if not match:
+        return None
+    return game_key(int(match.group(1)), int(match.group(2)))
+
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DATE_PATTERN = re.compile(r"^(?:(\d{4})-(\d{1,2})-(\d{1,2})|(\d{1,2})[./](\d{1,2})(?:[./](\d{2}|\d{4}))?)$")
+TIME_PATTERN = re.compile(r"^(\d{1,2})(?:[:.](\d{2}))?(am|pm)?$")
+# `10.12` may be 10:12 or 10 December; see parse_game_time
+DOTTED_PATTERN = re.compile(r"^\d{1,2}\.\d{2}$")
+FILLER_WORDS = {"at", "on"}
+
+
+def parse_game_time(text: str, tz, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Turn game times like `Sunday 18:00`, `tomorrow 8pm` or `12/05 18:30` into an aware datetime.
+
+    A weekday or a time alone means its next occurrence. `tz` is a pytz timezone.
+    A dotted pair like `18.30` is the time unless the text has a time with `:` or
+    am/pm, or another dotted pair follows it: `12.05 18.30` is 12 May at 18:30.
+    Returns None when the text isn't understood, so it can still be shown as is.
+    """
+    now = now.astimezone(tz) if now else datetime.now(tz)
+    day, weekday, clock = None, None, None
+    words = [word for word in text.lower().replace(",", " ").split() if word not in FILLER_WORDS]
+    dotted = [index for index, word in enumerate(words) if DOTTED_PATTERN.match(word)]
+    explicit_time = any(TIME_PATTERN.match(word) and (":" in word or word[-2:] in ("am", "pm")) for word in words)
+    dotted_time = dotted[-1] if dotted and not explicit_time else None
+    for index, word in enumerate(words):
+        if word in ("today", "tonight"):
+            day = now.date()
+        elif word == "tomorrow":
+            day = now.date() + timedelta(days=1)
+        elif any(name.startswith(word) for name in WEEKDAYS) and len(word) >= 3:
+            weekday = next(i for i, name in enumerate(WEEKDAYS) if name.startswith(word))
+        elif DATE_PATTERN.match(word) and index != dotted_time:
+            parts = DATE_PATTERN.match(word).groups()
+            try:
+                if parts[0]:
+                    day = date(int(parts[0]), int(parts[1]), int(parts[2]))
+                else:
+                    year = int(parts[5]) if parts[5] else now.year
+                    day = date(year + 2000 if year < 100 else year, int(parts[4]), int(parts[3]))
+                    if not parts[5] and day < now.date():
+                        day = day.replace(year=day.year + 1)
+            except ValueError:
+                return None
+        elif TIME_PATTERN.match(word) and (":" in word or "." in word or word[-2:] in ("am", "pm")):
+            hour, minute, half = TIME_PATTERN.match(word).groups()
+            hour, minute = int(hour), int(minute or 0)
+            if half:
+                if not 1 <= hour <= 12:
+                    return None
+                hour = hour % 12 + (12 if half == "pm" else 0)
+            if hour > 23 or minute > 59:
+                return None
+            clock = time(hour, minute)
+        else:
+            return None
+    if clock is None:
+        return None
+
+    if day is None:
+        day = now.date()
+        if weekday is not None:
+            day += timedelta(days=(weekday - day.weekday()) % 7)
+        if tz.localize(datetime.combine(day, clock)) <= now:
+            day += timedelta(days=7 if weekday is not None else 1)
+    elif weekday is not None and day.weekday() != weekday:
+        return None
+    return tz.localize(datetime.combine(day, clock))
+
+
+class GameClosed(Exception):
+    """Raised when a game is changed after it has been cleared."""
+
+
+class Game:
+    __slots__ = ("chat_id", "game_id", "game_datetime", "kickoff", "roster", "together", "apart", "teams", "reminders_sent",
+                 "unapproved_released", "capacity", "template_id", "publisher", "renderer", "closed", "_lock")
+
+    def __init__(self, chat_id: int, game_id: int, game_datetime: str, roster: Roster,
+                 kickoff: Optional[datetime] = None, capacity: Optional[int] = None, template_id: Optional[int] = None):
+        self.chat_id = chat_id
+        self.game_id = game_id
+        self.game_datetime = game_datetime
+        # Aware datetime parsed from game_datetime, None if it couldn't be understood
+        self.kickoff = kickoff
+        self.roster = roster
+        # Pairs of player names divide_teams keeps on the same or on different teams
+        self.together = []
+        self.apart = []
+        # Teams of the last /divide_teams, kept until the result is recorded
+        self.teams = None
+        # Hours before kickoff of the reminders already sent or skipped
+        self.reminders_sent = []
+        # Set once players who didn't approve were dropped shortly before kickoff
+        self.unapproved_released = False
+        # Player limit set by the game's template, None for the registry's default
+        self.capacity = capacity
+        # Template the game was created from, None for games created with /create_game
+        self.template_id = template_id
+        self.publisher = None
+        self.renderer = None
+        self.closed = False
+        self._lock = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @property
+    def key(self) -> str:
+        return game_key(self.chat_id, self.game_id)
+
+    @property
+    def link_payload(self) -> str:
+        return f"{self.chat_id}_{self.game_id}"
+
+    def mentions(self, name: str) -> bool:
+        """Whether a player name appears in the roster, the team pairings or the teams."""
+        return (name in self.roster or any(name in pair for pair in self.together + self.apart)
+                or any(name in team for team in self.teams or []))
+
+    def rename(self, old: str, new: str) -> bool:
+        """Give a player a new name in the roster, the team pairings and the teams.
+
+        Returns False, changing nothing, if `new` is already on the roster.
+        """
+        if new in self.roster:
+            return False
+        self.roster.rename(old, new)
+        for pairs in (self.together, self.apart):
+            pairs[:] = [tuple(new if name == old else name for name in pair) for pair in pairs]
+        if self.teams:
+            self.teams = [[new if name == old else name for name in team] for team in self.teams]
+        return True
+
+    def to_dict(self) -> dict:
+        return {
+            "chat_id": self.chat_id,
+            "game_id": self.game_id,
+            "game_datetime": self.game_datetime,
+            "kickoff": self.kickoff.isoformat() if self.kickoff else None,
+            "roster": self.roster.to_dict(),
+            "together": list(self.together),
+            "apart": list(self.apart),
+            "teams": self.teams,
+            "reminders_sent": list(self.reminders_sent),
+            "unapproved_released": self.unapproved_released,
+            "capacity": self.capacity,
+            "template_id": self.template_id,
+            "roster_message_id": self.publisher.message_id if self.publisher else None,
+        }
+
+
+class GameRegistry:
+    """All open games, keyed by chat ID and by game ID within the chat."""
+
+    def __init__(self, store, max_players: int, make_publisher: Callable[[Game], object],
+                 make_renderer: Callable[[Game], object]):
+        self.store = store
+        self.max_players = max_players
+        self.make_publisher = make_publisher
+        self.make_renderer = make_renderer
+        self.games: Dict[str, Game] = {}
+        self.by_chat: Dict[int, Dict[int, Game]] = {}
+        self.last_ids: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.games)
+
+    def __iter__(self) -> Iterator[Game]:
+        return iter(list(self.games.values()))
+
+    def get(self, key: str) -> Optional[Game]:
+        return self.games.get(key)
+
+    def in_chat(self, chat_id: int) -> List[Game]:
+        return list(self.by_chat.get(chat_id, {}).values())
+
+    def _add(self, game: Game) -> None:
+        game.renderer = self.make_renderer(game)
+        game.publisher = self.make_publisher(game)
+        self.games[game.key] = game
+        self.by_chat.setdefault(game.chat_id, {})[game.game_id] = game
+
+    def create(self, chat_id: int, game_datetime: str, kickoff: Optional[datetime] = None,
+               capacity: Optional[int] = None, template_id: Optional[int] = None) -> Game:
+        # Old roster buttons, deep links and selections must not reach a new game under a reused key
+        game_id = max(self.last_ids.get(chat_id, 0), max(self.by_chat.get(chat_id, {}), default=0)) + 1
+        self.last_ids[chat_id] = game_id
+        self.store.save(f"{LAST_GAME_ID_PREFIX}{chat_id}", game_id)
+        game = Game(chat_id, game_id, game_datetime, Roster(capacity or self.max_players), kickoff, capacity, template_id)
+        self._add(game)
+        self.save(game)
+        return game
+
+    async def apply(self, game: Game, change: Callable[..., Any], *args) -> Any:
+        """Run a state change on a game under its lock and persist the result.
+
+        `change` must be synchronous: checks and mutations happen in one step,
+        and any network I/O belongs after this call returns.
+        """
+        async with game.lock:
+            if game.closed:
+                raise GameClosed(game.key)
+            result = change(*args)
+            self.save(game)
+            return result
+
+    async def close(self, game: Game, archive_key: Optional[str] = None) -> None:
+        """Remove a game, keeping its final state under `archive_key` if one is given."""
+        async with game.lock:
+            if game.closed:
+                raise GameClosed(game.key)
+            if archive_key is not None:
+                self.store.save(archive_key, game.to_dict())
+            self.remove(game)
+
+    def remove(self, game: Game) -> None:
+        game.closed = True
+        self.games.pop(game.key, None)
+        chat_games = self.by_chat.get(game.chat_id)
+        if chat_games is not None:
+            chat_games.pop(game.game_id, None)
+            if not chat_games:
+                del self.by_chat[game.chat_id]
+        if game.publisher:
+            game.publisher.reset()
+        self.store.delete(GAME_KEY_PREFIX + game.key)
+
+    def save(self, game: Game) -> None:
+        # Serialized when the store flushes, once however many changes came in meanwhile
+        self.store.save(GAME_KEY_PREFIX + game.key, game.to_dict)
+
+    def load(self) -> None:
+        for key, game_id in self.store.load_prefix(LAST_GAME_ID_PREFIX).items():
+            self.last_ids[int(key[len(LAST_GAME_ID_PREFIX):])] = game_id
+        for data in self.store.load_prefix(GAME_KEY_PREFIX).values():
+            roster = Roster.from_dict(data["roster"])
+            roster.max_players = data.get("capacity") or self.max_players
+            kickoff = datetime.fromisoformat(data["kickoff"]) if data.get("kickoff") else None
+            game = Game(data["chat_id"], data["game_id"], data["game_datetime"], roster, kickoff,
+                        data.get("capacity"), data.get("template_id"))
+            game.together = [tuple(pair) for pair in data.get("together", [])]
+            game.apart = [tuple(pair) for pair in data.get("apart", [])]
+            game.teams = data.get("teams")
+            game.reminders_sent = data.get("reminders_sent", [])
+            game.unapproved_released = data.get("unapproved_released", False)
+            self._add(game)
+            game.publisher.message_id = data.get("roster_message_id")
+        logger.info(f"Loaded {len(self.games)} games in {len(self.by_chat)} chats")
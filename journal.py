@@ -0,0 +1,45 @@
+import asyncio
+import logging
+from typing import List
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+PENDING_UPDATE_PREFIX = "pending_update:"
+
+
+class UpdateJournal:
+    """Updates that were received but whose handling hasn't started, kept in the state store.
+
+    Telegram forgets an update once it is acknowledged, which for polling is
+    when the next batch is fetched, often before the update was handled. The
+    journal lets the next process handle what this one received but never got to.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def record(self, update: Update) -> None:
+        self.store.save(f"{PENDING_UPDATE_PREFIX}{update.update_id}", update.to_dict())
+
+    def done(self, update_id: int) -> None:
+        self.store.delete(f"{PENDING_UPDATE_PREFIX}{update_id}")
+
+    def pending(self, bot) -> List[Update]:
+        updates = [Update.de_json(data, bot) for data in self.store.load_prefix(PENDING_UPDATE_PREFIX).values()]
+        return sorted(updates, key=lambda update: update.update_id)
+
+
+class JournaledQueue(asyncio.Queue):
+    """Application update queue that records every update in a journal as it is queued."""
+
+    def __init__(self, journal: UpdateJournal):
+        super().__init__()
+        self.journal = journal
+
+    def put_nowait(self, item) -> None:
+        # The application also queues non-update items, e.g. its stop signal
+        if isinstance(item, Update):
+            self.journal.record(item)
+        super().put_nowait(item)
@@ -0,0 +1,168 @@
+import bisect
+import logging
+import time
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a cached reply to a slow API call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile; enough for a log line."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return bound
+        return float("inf")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Metrics:
+    """Counters and latency histograms kept in memory, rendered in the Prometheus text format.
+
+    Recording is a dict lookup and a few additions, cheap enough for every
+    update. Gauges are callbacks evaluated only when the metrics are rendered.
+    """
+
+    def __init__(self, prefix: str = "soccerbot"):
+        self.prefix = prefix
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.help: Dict[str, str] = {}
+        self.gauges: List[Tuple[str, str, Callable[[], Iterable[Tuple[Labels, float]]]]] = []
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1) -> None:
+        series = self.counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        series = self.histograms.setdefault(name, {})
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram()
+        histogram.observe(value)
+
+    def describe(self, name: str, text: str) -> None:
+        self.help[name] = text
+
+    def gauge(self, name: str, text: str, collect: Callable[[], Iterable[Tuple[Labels, float]]]) -> None:
+        """Register a gauge; `collect` returns (labels, value) pairs when the metrics are read."""
+        self.gauges.append((name, text, collect))
+
+    def render(self) -> str:
+        lines = []
+
+        def head(name: str, kind: str, text: Optional[str]) -> str:
+            full = f"{self.prefix}_{name}"
+            if text:
+                lines.append(f"# HELP {full} {text}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        for name, series in self.counters.items():
+            full = head(name, "counter", self.help.get(name))
+            for labels, value in series.items():
+                lines.append(f"{full}{_format_labels(labels)} {value:g}")
+        for name, series in self.histograms.items():
+            full = head(name, "histogram", self.help.get(name))
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{full}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+                lines.append(f"{full}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{full}_count{_format_labels(labels)} {histogram.count}")
+        for name, text, collect in self.gauges:
+            full = head(name, "gauge", text)
+            try:
+                for labels, value in collect():
+                    lines.append(f"{full}{_format_labels(labels)} {value:g}")
+            except Exception as e:
+                logger.error(f"Collecting gauge {name} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """One line per command and API method with count, errors and p50/p99, for the log."""
+        lines = []
+        for name in ("handler_seconds", "api_request_seconds"):
+            errors = self.counters.get(name.replace("_seconds", "_errors"), {})
+            for labels, histogram in sorted(self.histograms.get(name, {}).items()):
+                label = ",".join(value for _, value in labels)
+                lines.append(f"{name} {label}: {histogram.count} calls, {errors.get(labels, 0):g} errors, "
+                             f"p50 <= {histogram.quantile(0.5):g} s, p99 <= {histogram.quantile(0.99):g} s")
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+metrics.describe("handler_seconds", "Time spent in an update handler, including the API calls it waits for.")
+metrics.describe("handler_errors", "Handler calls that raised an exception.")
+metrics.describe("api_request_seconds", "Duration of Telegram Bot API requests by method.")
+metrics.describe("api_request_errors", "Telegram Bot API requests that failed or returned a non-200 status.")
+
+
+def instrumented(func):
+    """Record the latency and errors of a handler under its function name."""
+    labels = (("handler", func.__name__),)
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            metrics.inc("handler_errors", labels)
+            raise
+        finally:
+            metrics.observe("handler_seconds", labels, time.perf_counter() - started)
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records the duration and outcome of every Bot API call."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> Tuple[int, bytes]:
+        labels = (("method", url.rsplit("/", 1)[-1]),)
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            metrics.inc("api_request_errors", labels)
+            raise
+        finally:
+            metrics.observe("api_request_seconds", labels, time.perf_counter() - started)
+        if code != 200:
+            metrics.inc("api_request_errors", labels)
+        return code, payload
@@ -0,0 +1,311 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, lower goes first
+REPLY = 0
+BROADCAST = 1
+
+LATENCY_SAMPLES = 1000
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one is available now."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+class DeliveryReport:
+    """Outcome of a fan-out, listing recipients by the key they were given with."""
+
+    __slots__ = ("sent", "blocked", "failed")
+
+    def __init__(self):
+        self.sent: List[Hashable] = []
+        # Users who blocked the bot or never started a chat with it
+        self.blocked: List[Hashable] = []
+        self.failed: List[Hashable] = []
+
+    def __str__(self) -> str:
+        return f"{len(self.sent)} sent, {len(self.blocked)} blocked, {len(self.failed)} failed"
+
+
+class _Job:
+    __slots__ = ("chat_id", "priority", "call", "future", "context", "enqueued", "attempts")
+
+    def __init__(self, chat_id, priority: int, call: Callable[[], Awaitable[Any]]):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.call = call
+        self.future = asyncio.get_running_loop().create_future()
+        # Sends run in the caller's context, e.g. for the webhook inline reply
+        self.context = contextvars.copy_context()
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+
+
+class Outbox:
+    """Central queue for outgoing Telegram API calls.
+
+    Calls are spread over priority lanes and, within a lane, round-robin over
+    chats. A call is sent only when both the global token bucket and the bucket
+    of its chat have a token, with at most one call in flight per chat so
+    messages keep their order. RetryAfter pauses the chat for the requested
+    time and the call is retried; other network errors back off exponentially.
+    """
+
+    def __init__(self, global_rate: float = 30, group_rate: float = 20 / 60, private_rate: float = 1,
+                 group_burst: float = 3, private_burst: float = 3, max_in_flight: int = 16,
+                 max_attempts: int = 5, max_buckets: int = 10000):
+        self.group_rate = group_rate
+        self.private_rate = private_rate
+        self.group_burst = group_burst
+        self.private_burst = private_burst
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.max_buckets = max_buckets
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.lanes = (OrderedDict(), OrderedDict())
+        self.buckets: Dict[Any, TokenBucket] = {}
+        self.in_flight = set()
+        self.bot = None
+        self._wakeup = None
+        self._runner = None
+        self._tasks = set()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.flood_waits = 0
+
+    async def start(self, bot) -> None:
+        self.bot = bot
+        self._wakeup = asyncio.Event()
+        self._runner = asyncio.create_task(self._run())
+
+    def call(self, chat_id, priority: int, call: Callable[[], Awaitable[Any]]) -> "asyncio.Future[Any]":
+        """Queue an API call for `chat_id`; the returned future resolves with its result."""
+        job = _Job(chat_id, priority, call)
+        self.lanes[priority].setdefault(chat_id, deque()).append(job)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job.future
+
+    def send_message(self, chat_id, text: str, priority: int = BROADCAST, **kwargs) -> "asyncio.Future[Any]":
+        return self.call(chat_id, priority, lambda: self.bot.send_message(chat_id=chat_id, text=text, **kwargs))
+
+    def post(self, chat_id, text: str, priority: int = BROADCAST, **kwargs) -> None:
+        """Queue a message without waiting for it; failures are only logged."""
+        future = self.send_message(chat_id, text, priority, **kwargs)
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    async def fan_out(self, recipients: Dict[Hashable, int], text: str, priority: int = BROADCAST,
+                      concurrency: int = 32, **kwargs) -> DeliveryReport:
+        """Send `text` to many private chats, given as {key: chat_id}, and report per key.
+
+        At most `concurrency` messages are queued at a time, so a large fan-out
+        doesn't crowd out other chats' messages in the same lane.
+        """
+        report = DeliveryReport()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def deliver(key: Hashable, chat_id: int) -> None:
+            async with semaphore:
+                try:
+                    await self.send_message(chat_id, text, priority, **kwargs)
+                    report.sent.append(key)
+                except Forbidden:
+                    report.blocked.append(key)
+                except Exception:
+                    report.failed.append(key)
+
+        await asyncio.gather(*(deliver(key, chat_id) for key, chat_id in recipients.items()))
+        return report
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            if len(self.buckets) >= self.max_buckets:
+                self._prune_buckets()
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_rate, self.private_burst)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            self.buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_buckets(self) -> None:
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, bucket in self.buckets.items() if bucket.is_idle(now)]:
+            del self.buckets[chat_id]
+
+    def _next_job(self, now: float):
+        """Return the next sendable job, or None and the seconds until one may be."""
+        wait = None
+        for lane in self.lanes:
+            for chat_id, jobs in lane.items():
+                if chat_id in self.in_flight:
+                    continue
+                chat_wait = self._bucket(chat_id).wait_time(now)
+                if chat_wait == 0:
+                    job = jobs.popleft()
+                    if jobs:
+                        lane.move_to_end(chat_id)
+                    else:
+                        del lane[chat_id]
+                    return job, None
+                wait = chat_wait if wait is None else min(wait, chat_wait)
+        return None, wait
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            job, wait = None, None
+            if len(self._tasks) < self.max_in_flight:
+                wait = self.global_bucket.wait_time(now)
+                if not wait:
+                    job, wait = self._next_job(now)
+            if job is None:
+                self._wakeup.clear()
+                # Not wait_for: a cancel arriving just as its timeout expires can be lost, hanging stop()
+                timeout = asyncio.get_running_loop().call_later(wait, self._wakeup.set) if wait is not None else None
+                try:
+                    await self._wakeup.wait()
+                finally:
+                    if timeout is not None:
+                        timeout.cancel()
+                continue
+            self.global_bucket.take(now)
+            self._bucket(job.chat_id).take(now)
+            self.in_flight.add(job.chat_id)
+            task = job.context.run(asyncio.create_task, self._send(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _send(self, job: _Job) -> None:
+        job.attempts += 1
+        backoff = None
+        try:
+            result = await job.call()
+        except RetryAfter as e:
+            retry_after = e.retry_after if isinstance(e.retry_after, (int, float)) else e.retry_after.total_seconds()
+            self.flood_waits += 1
+            self._bucket(job.chat_id).paused_until = time.monotonic() + retry_after
+            logger.warning(f"Flood wait of {retry_after}s for chat {job.chat_id}")
+            backoff = 0
+            error = e
+        except (BadRequest, TimedOut) as e:
+            # Not retried: a timed out send may still have been delivered
+            error = e
+        except NetworkError as e:
+            backoff = min(2 ** job.attempts, 30)
+            error = e
+        except Exception as e:
+            error = e
+        else:
+            self.sent += 1
+            self._latencies.append(time.monotonic() - job.enqueued)
+            if not job.future.done():
+                job.future.set_result(result)
+            self.in_flight.discard(job.chat_id)
+            return
+
+        try:
+            if backoff is not None and job.attempts < self.max_attempts:
+                self.retried += 1
+                if backoff:
+                    # The chat stays in flight meanwhile so later messages don't overtake this one
+                    await asyncio.sleep(backoff)
+                self.lanes[job.priority].setdefault(job.chat_id, deque()).appendleft(job)
+                self.lanes[job.priority].move_to_end(job.chat_id, last=False)
+                return
+            self.failed += 1
+            if isinstance(error, Forbidden):
+                # The user blocked the bot or never started it, which is common for private chats
+                logger.info(f"Chat {job.chat_id} is not reachable: {error}")
+            else:
+                logger.error(f"Giving up on API call for chat {job.chat_id} after {job.attempts} attempts: {error}")
+            if not job.future.done():
+                job.future.set_exception(error)
+        finally:
+            self.in_flight.discard(job.chat_id)
+
+    def queue_depth(self, priority: Optional[int] = None) -> int:
+        lanes = self.lanes if priority is None else (self.lanes[priority],)
+        return sum(len(jobs) for lane in lanes for jobs in lane.values())
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+        return {
+            "queued_replies": self.queue_depth(REPLY),
+            "queued_broadcasts": self.queue_depth(BROADCAST),
+            "in_flight": len(self._tasks),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "flood_waits": self.flood_waits,
+            "latency_p50": percentile(0.5),
+            "latency_p99": percentile(0.99),
+        }
+
+    async def stop(self, timeout: float = 10) -> None:
+        """Send what is still queued, waiting at most `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while (self.queue_depth() or self._tasks) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        for lane in self.lanes:
+            for jobs in lane.values():
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.cancel()
+            lane.clear()
+        logger.info(f"Outbox stopped: {self.stats()}")
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from telegram.error import BadRequest, TelegramError
+
+from outbox import BROADCAST
+
+logger = logging.getLogger(__name__)
+
+
+class RosterPublisher:
+    """Keeps a single pinned roster message in a group chat up to date.
+
+    Changes requested within `delay` seconds are collapsed into one edit, and
+    the Telegram call is skipped when the rendered text did not change.
+    `reply_markup`, e.g. an inline keyboard, is attached to the message.
+    """
+
+    def __init__(self, chat_id, render: Callable[[], Optional[str]], outbox, delay: float = 3.0,
+                 on_new_message: Optional[Callable[[], None]] = None, reply_markup=None):
+        self.chat_id = chat_id
+        self.render = render
+        self.outbox = outbox
+        self.reply_markup = reply_markup
+        self.delay = delay
+        self.on_new_message = on_new_message
+        self.message_id = None
+        self.last_text = None
+        self._pending = None
+        self._lock = None
+
+    def request_update(self, bot) -> None:
+        if self._pending is not None and not self._pending.done():
+            return
+        self._pending = asyncio.create_task(self._publish_later(bot))
+
+    async def _publish_later(self, bot) -> None:
+        await asyncio.sleep(self.delay)
+        self._pending = None
+        try:
+            await self.publish(bot)
+        except Exception as e:
+            logger.error(f"Failed to publish roster to chat {self.chat_id}: {e}")
+
+    async def flush(self, bot) -> None:
+        """Publish a pending change now instead of after the delay, e.g. before shutting down."""
+        if self._pending is None or self._pending.done():
+            return
+        self._pending.cancel()
+        self._pending = None
+        await self.publish(bot)
+
+    async def publish(self, bot, repost: bool = False) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            text = self.render()
+            if text is None:
+                return
+            if not repost and self.message_id is not None and text == self.last_text:
+                logger.info("Roster unchanged, skipping update")
+                return
+            if not repost and self.message_id is not None:
+                try:
+                    message_id = self.message_id
+                    await self.outbox.call(self.chat_id, BROADCAST, lambda: bot.edit_message_text(
+                        chat_id=self.chat_id, message_id=message_id, text=text, reply_markup=self.reply_markup))
+                    self.last_text = text
+                    logger.info("Roster message edited in group chat")
+                    return
+                except BadRequest as e:
+                    if "not modified" in str(e).lower():
+                        self.last_text = text
+                        return
+                    logger.warning(f"Could not edit roster message, posting a new one: {e}")
+            message = await self.outbox.call(self.chat_id, BROADCAST, lambda: bot.send_message(
+                chat_id=self.chat_id, text=text, reply_markup=self.reply_markup))
+            self.message_id = message.message_id
+            self.last_text = text
+            if self.on_new_message:
+                self.on_new_message()
+            logger.info("Roster message posted to group chat")
+            try:
+                message_id = self.message_id
+                await self.outbox.call(self.chat_id, BROADCAST, lambda: bot.pin_chat_message(
+                    chat_id=self.chat_id, message_id=message_id, disable_notification=True))
+            except TelegramError as e:
+                logger.warning(f"Could not pin roster message: {e}")
+
+    def reset(self) -> None:
+        if self._pending is not None and not self._pending.done():
+            self._pending.cancel()
+        self._pending = None
+        self.message_id = None
+        self.last_text = None
@@ -0,0 +1,186 @@
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+DEFAULT_RATING = 1000.0
+K_FACTOR = 32.0
+
+
+class PlayerStats:
+    __slots__ = ("name", "base", "rating", "games", "wins", "draws", "losses", "no_shows")
+
+    def __init__(self, name: str, base: float = DEFAULT_RATING):
+        self.name = name
+        self.base = base
+        self.rating = base
+        self.games = 0
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        self.no_shows = 0
+
+    @property
+    def attendance_rate(self) -> float:
+        expected = self.games + self.no_shows
+        return self.games / expected if expected else 0.0
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.games if self.games else 0.0
+
+    def reset(self) -> None:
+        self.rating = self.base
+        self.games = self.wins = self.draws = self.losses = self.no_shows = 0
+
+    def to_list(self) -> list:
+        return [self.base, self.rating, self.games, self.wins, self.draws, self.losses, self.no_shows]
+
+    @classmethod
+    def from_list(cls, name: str, values: list) -> "PlayerStats":
+        stats = cls(name)
+        (stats.base, stats.rating, stats.games, stats.wins, stats.draws, stats.losses, stats.no_shows) = values
+        return stats
+
+
+class MatchRecord:
+    """One recorded match: the teams, the result and the rating change of every player."""
+
+    __slots__ = ("match_id", "played_at", "teams", "winner", "absent", "deltas")
+
+    def __init__(self, match_id: str, played_at: float, teams: List[List[str]], winner: Optional[int],
+                 absent: List[str], deltas: Dict[str, float]):
+        self.match_id = match_id
+        self.played_at = played_at
+        self.teams = teams
+        self.winner = winner
+        self.absent = absent
+        self.deltas = deltas
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MatchRecord":
+        return cls(**data)
+
+    def rename(self, old: str, new: str) -> bool:
+        """Replace a player name throughout the record; returns whether it appeared."""
+        if not any(old in team for team in self.teams) and old not in self.absent:
+            return False
+        self.teams = [[new if name == old else name for name in team] for team in self.teams]
+        self.absent = [new if name == old else name for name in self.absent]
+        if old in self.deltas:
+            self.deltas[new] = self.deltas.pop(old)
+        return True
+
+
+class RatingBook:
+    """Elo ratings and per-player aggregates, updated incrementally per match.
+
+    A match with several teams and one winner counts as a win of the winning
+    team against each other team; a draw counts as a draw between every pair.
+    Team strength is the average rating of the players who showed up.
+    """
+
+    def __init__(self, k_factor: float = K_FACTOR, default_rating: float = DEFAULT_RATING):
+        self.k_factor = k_factor
+        self.default_rating = default_rating
+        self.players: Dict[str, PlayerStats] = {}
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+    def get(self, name: str, default: Optional[float] = None) -> Optional[float]:
+        stats = self.players.get(name)
+        return stats.rating if stats else default
+
+    def stats(self, name: str) -> Optional[PlayerStats]:
+        return self.players.get(name)
+
+    def _player(self, name: str) -> PlayerStats:
+        stats = self.players.get(name)
+        if stats is None:
+            stats = self.players[name] = PlayerStats(name, self.default_rating)
+        return stats
+
+    def rename(self, old: str, new: str) -> bool:
+        """Move a player's stats to a new name; False if they have none or the name is taken."""
+        if old not in self.players or new in self.players:
+            return False
+        stats = self.players[new] = self.players.pop(old)
+        stats.name = new
+        return True
+
+    def set_base(self, name: str, rating: float) -> None:
+        stats = self._player(name)
+        stats.rating += rating - stats.base
+        stats.base = rating
+
+    def compute(self, teams: Sequence[Sequence[str]], winner: Optional[int], absent: Iterable[str] = (),
+                played_at: Optional[float] = None) -> MatchRecord:
+        """Work out the rating deltas of a match without applying them."""
+        absent = set(absent)
+        present = [[name for name in team if name not in absent] for team in teams]
+        strengths = [
+            sum(self.get(name, self.default_rating) for name in team) / len(team) if team else self.default_rating
+            for team in present
+        ]
+        team_deltas = [0.0] * len(teams)
+        pairs = [(a, b) for a in range(len(teams)) for b in range(a + 1, len(teams)) if present[a] and present[b]]
+        if winner is not None:
+            pairs = [(a, b) for a, b in pairs if winner in (a, b)]
+        opponents = max(1, len(teams) - 1)
+        for a, b in pairs:
+            expected = 1 / (1 + 10 ** ((strengths[b] - strengths[a]) / 400))
+            score = 0.5 if winner is None else (1.0 if winner == a else 0.0)
+            change = self.k_factor * (score - expected) / opponents
+            team_deltas[a] += change
+            team_deltas[b] -= change
+        deltas = {name: team_deltas[i] for i, team in enumerate(present) for name in team}
+        played_at = time.time() if played_at is None else played_at
+        return MatchRecord(f"{int(played_at * 1000):013d}", played_at, [list(team) for team in teams],
+                           winner, sorted(absent), deltas)
+
+    def apply(self, record: MatchRecord) -> None:
+        for name in record.absent:
+            self._player(name).no_shows += 1
+        for i, team in enumerate(record.teams):
+            for name in team:
+                if name not in record.deltas:
+                    continue
+                stats = self._player(name)
+                stats.rating += record.deltas[name]
+                stats.games += 1
+                if record.winner is None:
+                    stats.draws += 1
+                elif record.winner == i:
+                    stats.wins += 1
+                else:
+                    stats.losses += 1
+
+    def record(self, teams: Sequence[Sequence[str]], winner: Optional[int], absent: Iterable[str] = ()) -> MatchRecord:
+        record = self.compute(teams, winner, absent)
+        self.apply(record)
+        return record
+
+    def replay(self, records: Iterable[MatchRecord]) -> int:
+        """Recompute every rating from the base ratings and the given match history."""
+        for stats in self.players.values():
+            stats.reset()
+        count = 0
+        for record in sorted(records, key=lambda r: r.played_at):
+            fresh = self.compute(record.teams, record.winner, record.absent, record.played_at)
+            record.deltas = fresh.deltas
+            self.apply(record)
+            count += 1
+        return count
+
+    def to_dict(self) -> dict:
+        return {name: stats.to_list() for name, stats in self.players.items()}
+
+    def load(self, data: dict) -> None:
+        for name, values in data.items():
+            if isinstance(values, (int, float)):
+                # Plain ratings as saved by /set_rating before match results were kept
+                self.players[name] = PlayerStats(name, float(values))
+            else:
+                self.players[name] = PlayerStats.from_list(name, values)
@@ -0,0 +1,282 @@
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+PLAYING = "playing"
+WAITING = "waiting"
+
+
+class PlayerEntry:
+    __slots__ = ("name", "user_id", "approved", "bringing_ball", "offer_deadline")
+
+    def __init__(self, name: str, user_id: Optional[int] = None):
+        self.name = name
+        # Telegram user ID for private messages, unknown for players an admin registered
+        self.user_id = user_id
+        self.approved = False
+        self.bringing_ball = False
+        # UNIX time by which a player promoted from the waiting list must approve, None if not on offer
+        self.offer_deadline = None
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PlayerEntry":
+        entry = cls(data["name"])
+        for slot in cls.__slots__:
+            if slot in data:
+                setattr(entry, slot, data[slot])
+        return entry
+
+
+class Roster:
+    """Playing and waiting lists of a game.
+
+    Both lists are ordered dicts keyed by player name, so membership checks,
+    removal from any position and promotion from the head of the waiting list
+    are all O(1). Every change bumps `version` and records the names whose
+    rendered line may differ, for RosterRenderer.
+    """
+
+    def __init__(self, max_players: int):
+        self.max_players = max_players
+        self.playing = OrderedDict()
+        self.waiting = OrderedDict()
+        self.version = 0
+        self.changed: Set[str] = set()
+
+    def _touch(self, name: str) -> None:
+        self.version += 1
+        self.changed.add(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.playing or name in self.waiting
+
+    def __len__(self) -> int:
+        return len(self.playing) + len(self.waiting)
+
+    def get(self, name: str) -> Optional[PlayerEntry]:
+        return self.playing.get(name) or self.waiting.get(name)
+
+    def status(self, name: str) -> Optional[str]:
+        if name in self.playing:
+            return PLAYING
+        if name in self.waiting:
+            return WAITING
+        return None
+
+    def is_full(self) -> bool:
+        return len(self.playing) >= self.max_players
+
+    def add(self, name: str, user_id: Optional[int] = None) -> Optional[str]:
+        """Add a player and return the list they landed on, or None if already registered.
+
+        A known user ID is recorded even for a player who is already registered.
+        """
+        entry = self.get(name)
+        if entry is not None:
+            if user_id is not None:
+                entry.user_id = user_id
+            return None
+        self._touch(name)
+        if self.is_full():
+            self.waiting[name] = PlayerEntry(name, user_id)
+            return WAITING
+        self.playing[name] = PlayerEntry(name, user_id)
+        return PLAYING
+
+    def add_many(self, names: List[str]) -> int:
+        """Register several players in order in one change; returns how many were new."""
+        return sum(self.add(name) is not None for name in names)
+
+    def remove(self, name: str, offer_deadline: Optional[float] = None) -> Tuple[Optional[str], Optional[PlayerEntry]]:
+        """Remove a player.
+
+        Returns the list they were removed from and the waiting player that was
+        promoted into the freed slot, if any.
+        """
+        if name in self.playing:
+            del self.playing[name]
+            self._touch(name)
+            return PLAYING, self.promote(offer_deadline)
+        if name in self.waiting:
+            del self.waiting[name]
+            self._touch(name)
+            return WAITING, None
+        return None, None
+
+    def promote(self, offer_deadline: Optional[float] = None) -> Optional[PlayerEntry]:
+        """Move the head of the waiting list into a free slot, on offer until `offer_deadline` if given."""
+        if not self.waiting or self.is_full():
+            return None
+        _, entry = self.waiting.popitem(last=False)
+        entry.offer_deadline = offer_deadline
+        self.playing[entry.name] = entry
+        self._touch(entry.name)
+        return entry
+
+    def expire_offer(self, name: str, offer_deadline: Optional[float] = None) -> Tuple[bool, Optional[PlayerEntry]]:
+        """Take the slot from a player who didn't approve in time and offer it to the next waiting player.
+
+        The player leaves the roster, so a cascade of expiring offers always ends.
+        Returns whether the offer was still open and the newly promoted player, if any.
+        """
+        entry = self.playing.get(name)
+        if entry is None or entry.offer_deadline is None or entry.approved:
+            return False, None
+        del self.playing[name]
+        self._touch(name)
+        return True, self.promote(offer_deadline)
+
+    def release_unapproved(self, offer_deadline: Optional[float] = None) -> Tuple[List[str], List[PlayerEntry]]:
+        """Drop playing players who haven't approved and aren't on a running offer.
+
+        Only as many as there are waiting players are released, latest registered
+        first, so nobody loses a slot no one else wants. Returns the released
+        names and the waiting players promoted into their slots.
+        """
+        unapproved = [entry.name for entry in self.playing.values() if not entry.approved and entry.offer_deadline is None]
+        released = unapproved[::-1][:len(self.waiting)]
+        for name in released:
+            del self.playing[name]
+            self._touch(name)
+        promoted = []
+        while True:
+            entry = self.promote(offer_deadline)
+            if entry is None:
+                break
+            promoted.append(entry)
+        return released, promoted
+
+    def rename(self, old: str, new: str) -> Optional[PlayerEntry]:
+        """Give a player a new name in place, keeping their position and flags."""
+        if new in self:
+            return None
+        for players in (self.playing, self.waiting):
+            entry = players.get(old)
+            if entry is None:
+                continue
+            entry.name = new
+            items = [(new if name == old else name, player) for name, player in players.items()]
+            players.clear()
+            players.update(items)
+            self._touch(old)
+            self._touch(new)
+            return entry
+        return None
+
+    def approve(self, name: str) -> bool:
+        entry = self.playing.get(name)
+        if entry is None:
+            return False
+        entry.approved = True
+        entry.offer_deadline = None
+        self._touch(name)
+        return True
+
+    def toggle_ball(self, name: str) -> Optional[bool]:
+        """Flip the ball flag of a playing player and return the new value."""
+        entry = self.playing.get(name)
+        if entry is None:
+            return None
+        entry.bringing_ball = not entry.bringing_ball
+        self._touch(name)
+        return entry.bringing_ball
+
+    def playing_names(self) -> List[str]:
+        return list(self.playing)
+
+    def waiting_names(self) -> List[str]:
+        return list(self.waiting)
+
+    def unapproved(self) -> List[str]:
+        return [entry.name for entry in self.playing.values() if not entry.approved]
+
+    def entries(self) -> Iterator[PlayerEntry]:
+        yield from self.playing.values()
+        yield from self.waiting.values()
+
+    def clear(self) -> None:
+        self.changed.update(self.playing)
+        self.changed.update(self.waiting)
+        self.version += 1
+        self.playing.clear()
+        self.waiting.clear()
+
+    def to_dict(self) -> dict:
+        return {
+            "max_players": self.max_players,
+            "playing": [entry.to_dict() for entry in self.playing.values()],
+            "waiting": [entry.to_dict() for entry in self.waiting.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Roster":
+        roster = cls(data["max_players"])
+        for item in data.get("playing", []):
+            entry = PlayerEntry.from_dict(item)
+            roster.playing[entry.name] = entry
+        for item in data.get("waiting", []):
+            entry = PlayerEntry.from_dict(item)
+            roster.waiting[entry.name] = entry
+        return roster
+
+
+class RosterRenderer:
+    """Renders a roster as text, reusing each player's line between renders.
+
+    Only lines of players the roster reports as changed are rebuilt, the text
+    is joined in one pass, and the whole text is served from a snapshot until
+    the roster or the header changes.
+    """
+
+    def __init__(self, roster: Roster, approve_mark: str, ball_mark: str, offer_mark: str = ""):
+        self.roster = roster
+        self.approve_mark = approve_mark
+        self.ball_mark = ball_mark
+        self.offer_mark = offer_mark
+        self._lines: Dict[str, str] = {}
+        self._prefixes: List[str] = []
+        self._snapshot = None
+        self._snapshot_key = None
+
+    def _playing_line(self, entry: PlayerEntry) -> str:
+        line = self._lines.get(entry.name)
+        if line is None:
+            approval_status = self.approve_mark if entry.approved else ""
+            ball_status = self.ball_mark if entry.bringing_ball else ""
+            offer_status = self.offer_mark if entry.offer_deadline else ""
+            line = self._lines[entry.name] = f"@{entry.name} {approval_status}{ball_status}{offer_status}\n"
+        return line
+
+    def _waiting_line(self, entry: PlayerEntry) -> str:
+        line = self._lines.get(entry.name)
+        if line is None:
+            line = self._lines[entry.name] = f"@{entry.name}\n"
+        return line
+
+    def _prefix(self, i: int) -> str:
+        while len(self._prefixes) < i:
+            self._prefixes.append(f"{len(self._prefixes) + 1}. ")
+        return self._prefixes[i - 1]
+
+    def render(self, header: str) -> str:
+        roster = self.roster
+        key = (roster.version, header)
+        if key == self._snapshot_key:
+            return self._snapshot
+        if roster.changed:
+            for name in roster.changed:
+                self._lines.pop(name, None)
+            roster.changed.clear()
+        parts = [header, "Playing List:\n"]
+        for i, entry in enumerate(roster.playing.values(), 1):
+            parts.append(self._prefix(i))
+            parts.append(self._playing_line(entry))
+        parts.append("\nWaiting List:\n")
+        for i, entry in enumerate(roster.waiting.values(), 1):
+            parts.append(self._prefix(i))
+            parts.append(self._waiting_line(entry))
+        self._snapshot = "".join(parts)
+        self._snapshot_key = key
+        return self._snapshot
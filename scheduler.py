@@ -0,0 +1,125 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Longest single sleep, so wall clock jumps and suspends are noticed
+MAX_SLEEP = 300
+
+
+class _Timer:
+    __slots__ = ("when", "seq", "key", "callback", "args", "cancelled")
+
+    def __init__(self, when: float, seq: int, key: Hashable, callback: Callable[..., Awaitable[Any]], args: tuple):
+        self.when = when
+        self.seq = seq
+        self.key = key
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other: "_Timer") -> bool:
+        return (self.when, self.seq) < (other.when, other.seq)
+
+
+class Scheduler:
+    """One task running keyed callbacks at wall-clock times from a heap.
+
+    The task sleeps until the earliest timer is due and is woken early only when
+    an earlier timer is added. Keys are tuples whose first item names a group,
+    e.g. a game key, so everything scheduled for a game can be cancelled at once.
+    Scheduling a key again replaces its timer; cancelled timers stay in the heap
+    and are skipped when they come up.
+    """
+
+    def __init__(self):
+        self._heap: List[_Timer] = []
+        self._timers: Dict[Hashable, _Timer] = {}
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._runner = None
+        self._tasks = set()
+        self.fired = 0
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._runner = asyncio.create_task(self._run())
+
+    def schedule(self, when: float, key: Hashable, callback: Callable[..., Awaitable[Any]], *args) -> None:
+        """Run `await callback(*args)` at the UNIX timestamp `when`."""
+        self.cancel(key)
+        timer = _Timer(when, next(self._seq), key, callback, args)
+        self._timers[key] = timer
+        heapq.heappush(self._heap, timer)
+        if self._wakeup is not None and self._heap[0] is timer:
+            self._wakeup.set()
+
+    def when(self, key: Hashable) -> Optional[float]:
+        timer = self._timers.get(key)
+        return timer.when if timer else None
+
+    def cancel(self, key: Hashable) -> bool:
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        timer.cancelled = True
+        return True
+
+    def cancel_group(self, group: Hashable) -> int:
+        keys = [key for key in self._timers if isinstance(key, tuple) and key and key[0] == group]
+        for key in keys:
+            self.cancel(key)
+        return len(keys)
+
+    async def _run(self) -> None:
+        while True:
+            while self._heap and self._heap[0].cancelled:
+                heapq.heappop(self._heap)
+            wait = MAX_SLEEP
+            if self._heap:
+                wait = min(wait, self._heap[0].when - time.time())
+            if wait > 0:
+                self._wakeup.clear()
+                # Not wait_for: a cancel arriving just as its timeout expires can be lost, hanging stop()
+                timeout = asyncio.get_running_loop().call_later(wait, self._wakeup.set)
+                try:
+                    await self._wakeup.wait()
+                finally:
+                    timeout.cancel()
+                continue
+            timer = heapq.heappop(self._heap)
+            del self._timers[timer.key]
+            self.fired += 1
+            task = asyncio.create_task(self._fire(timer))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fire(self, timer: _Timer) -> None:
+        try:
+            await timer.callback(*timer.args)
+        except Exception as e:
+            logger.error(f"Scheduled job {timer.key} failed: {e}")
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop firing timers and wait at most `timeout` seconds for running callbacks, then cancel them."""
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"Cancelled {len(pending)} scheduled jobs still running at shutdown")
+                await asyncio.wait(pending)
@@ -1,386 +1,1297 @@
 import logging
 import asyncio
 import os
-import requests
+import signal
+import sys
+import hashlib
+import json
+import math
+import random
+import time
 import telegram
-from telegram import Update, BotCommand, ChatMemberUpdated, ChatMember
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, ChatMemberHandler, filters
-from telegram.error import NetworkError, TimedOut
+from telegram import Update, BotCommand, ChatMemberUpdated, ChatMember, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import (ApplicationBuilder, ApplicationHandlerStop, CallbackQueryHandler, CommandHandler, ContextTypes,
+                          ChatMemberHandler, TypeHandler, filters)
+from telegram.error import Forbidden, NetworkError, TimedOut
 from datetime import datetime
 import pytz
 from functools import wraps
-import random
-from typing import Optional, Tuple
-from datetime import datetime, time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
 import pytz
 import asyncio
+from publisher import RosterPublisher
+from roster import RosterRenderer, PLAYING, WAITING
+from storage import StateStore
+from games import Game, GameClosed, GameRegistry, parse_game_key, parse_game_time
+from admins import AdminCache, ADMIN_STATUSES
+from webhook import WebhookBot, WebhookReceiver
+from webserver import HTTPServer, Request, Response
+from outbox import Outbox, DeliveryReport, REPLY
+from teams import balance_teams
+from ratings import RatingBook, MatchRecord, DEFAULT_RATING
+from scheduler import Scheduler
+from templates import GameTemplate, TemplateRegistry
+from directory import UserDirectory
+from throttle import Throttle, THROTTLED
+from journal import JournaledQueue, UpdateJournal
+from metrics import metrics, instrumented, InstrumentedRequest
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
-GROUP_CHAT_ID = os.environ.get('GROUP_CHAT_ID')
+# Optional default group for games created from a private chat
+GROUP_CHAT_ID = int(os.environ['GROUP_CHAT_ID']) if os.environ.get('GROUP_CHAT_ID') else None
+
+if not BOT_TOKEN:
+    raise ValueError("BOT_TOKEN must be set as an environment variable")
+
+# 'polling' (default) or 'webhook'
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/telegram')
+PORT = int(os.environ.get('PORT', 8443))
+# Bot API server; point it at a local Bot API server or the fake one in benchmarks/loadtest.py
+BOT_API_URL = os.environ.get('BOT_API_URL', 'https://api.telegram.org').rstrip('/')
 
-if not BOT_TOKEN or not GROUP_CHAT_ID:
-    raise ValueError("BOT_TOKEN and GROUP_CHAT_ID must be set as environment variables")
+if BOT_MODE == 'webhook' and not (WEBHOOK_URL and WEBHOOK_SECRET):
+    raise ValueError("WEBHOOK_URL and WEBHOOK_SECRET must be set in webhook mode")
+
+ALLOWED_UPDATES = ['message', 'callback_query', 'chat_member']
 
 APPROVE_EMOJI = "✅"
 BALL_EMOJI = "⚽"
+OFFER_EMOJI = "⏳"
 
-MAX_PLAYERS = 15
-game_datetime = None
-playing_list = []
-waiting_list = []
-approvals = {}
-bringing_ball = set()
-game_created = False
+# Seconds to collect roster changes before the pinned roster message is edited
+ROSTER_UPDATE_DELAY = float(os.environ.get('ROSTER_UPDATE_DELAY', 3))
 
-def check_internet_connection():
-    try:
-        requests.get("https://api.telegram.org", timeout=5)
-        logger.info("Internet connection is available.")
-        return True
-    except requests.ConnectionError:
-        logger.error("No internet connection available.")
-        return False
+# SQLite file holding the game state so it survives restarts
+STATE_DB_PATH = os.environ.get('STATE_DB_PATH', 'soccer_bot.db')
+
+MAX_PLAYERS = int(os.environ.get('MAX_PLAYERS', 15))
+MAX_GAMES_PER_CHAT = int(os.environ.get('MAX_GAMES_PER_CHAT', 10))
+
+# Number of updates handled at the same time; 1 keeps the default sequential processing
+CONCURRENT_UPDATES = int(os.environ.get('CONCURRENT_UPDATES', 1))
+
+# Seconds a shutdown waits for each of: webhook handlers, scheduled jobs, background jobs and queued messages
+SHUTDOWN_TIMEOUT = float(os.environ.get('SHUTDOWN_TIMEOUT', 10))
+# Seconds a chat's admin list is trusted before it is fetched again
+ADMIN_CACHE_TTL = float(os.environ.get('ADMIN_CACHE_TTL', 600))
+# Commands a user may send per minute after a burst of COMMAND_BURST, and the seconds within which
+# a repeat of the same user's last command is dropped if the command is in IDEMPOTENT_COMMANDS
+COMMAND_RATE_PER_MINUTE = float(os.environ.get('COMMAND_RATE_PER_MINUTE', 20))
+COMMAND_BURST = float(os.environ.get('COMMAND_BURST', 5))
+DUPLICATE_COMMAND_SECONDS = float(os.environ.get('DUPLICATE_COMMAND_SECONDS', 5))
+IDEMPOTENT_COMMANDS = {'/start', '/print_list', '/print_list_to_group', '/approve', '/templates', '/stats', '/get_chat_id'}
+# Users whose latest username is remembered, least recently seen dropped first
+USER_DIRECTORY_SIZE = int(os.environ.get('USER_DIRECTORY_SIZE', 10000))
+
+# Telegram allows about 30 messages per second overall and 20 per minute in a group
+OUTBOX_GLOBAL_RATE = float(os.environ.get('OUTBOX_GLOBAL_RATE', 30))
+OUTBOX_GROUP_RATE_PER_MINUTE = float(os.environ.get('OUTBOX_GROUP_RATE_PER_MINUTE', 20))
+
+# Teams made by /divide_teams and the seconds it may spend balancing them
+TEAM_COUNT = int(os.environ.get('TEAM_COUNT', 3))
+TEAM_BALANCE_TIME_BUDGET = float(os.environ.get('TEAM_BALANCE_TIME_BUDGET', 0.05))
+ELO_K_FACTOR = float(os.environ.get('ELO_K_FACTOR', 32))
+
+# Timezone game times are given in, and the hours before kickoff reminders go out
+GAME_TIMEZONE = pytz.timezone(os.environ.get('GAME_TIMEZONE', 'Asia/Jerusalem'))
+REMINDER_HOURS = sorted((float(hours) for hours in os.environ.get('REMINDER_HOURS', '24,4,1').split(',')), reverse=True)
+# Where automatic reminders go: 'group', 'dm' (a private message to each unapproved player) or 'both'
+REMINDER_MODE = os.environ.get('REMINDER_MODE', 'group')
+REMINDER_MODES = ('group', 'dm', 'both')
+if REMINDER_MODE not in REMINDER_MODES:
+    raise ValueError(f"REMINDER_MODE must be one of {', '.join(REMINDER_MODES)}")
+
+# Minutes a promoted waiting player has to approve before the slot moves on, 0 to promote without asking
+PROMOTION_CONFIRM_MINUTES = float(os.environ.get('PROMOTION_CONFIRM_MINUTES', 60))
+# Hours before kickoff at which players who haven't approved lose their slot to the waiting list, 0 to keep them
+RELEASE_UNAPPROVED_HOURS = float(os.environ.get('RELEASE_UNAPPROVED_HOURS', 0.5))
+# Hours after kickoff at which a game created from a template is archived and the next week's game opens
+GAME_ARCHIVE_HOURS = float(os.environ.get('GAME_ARCHIVE_HOURS', 6))
+# Private reminders waiting in the outbox at a time
+DM_FANOUT_CONCURRENCY = int(os.environ.get('DM_FANOUT_CONCURRENCY', 32))
 
-async def check_telegram_api(bot):
+# Prometheus text endpoint at http://METRICS_HOST:METRICS_PORT/metrics, off unless a port is set
+METRICS_PORT = int(os.environ['METRICS_PORT']) if os.environ.get('METRICS_PORT') else None
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+# Seconds between metric summaries in the log, 0 to turn them off
+METRICS_LOG_INTERVAL = float(os.environ.get('METRICS_LOG_INTERVAL', 3600))
+
+state_store = StateStore(STATE_DB_PATH)
+admin_cache = AdminCache(ttl=ADMIN_CACHE_TTL)
+users = UserDirectory(state_store, max_users=USER_DIRECTORY_SIZE)
+throttle = Throttle(COMMAND_RATE_PER_MINUTE / 60, COMMAND_BURST, DUPLICATE_COMMAND_SECONDS,
+                    idempotent=IDEMPOTENT_COMMANDS, max_users=USER_DIRECTORY_SIZE)
+journal = UpdateJournal(state_store)
+outbox = Outbox(global_rate=OUTBOX_GLOBAL_RATE, group_rate=OUTBOX_GROUP_RATE_PER_MINUTE / 60)
+scheduler = Scheduler()
+
+# Monotonic time the process started, for the cold start timings
+STARTED_AT = time.monotonic()
+first_update_seconds = None
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30) -> float:
+    # Full jitter, so restarted instances don't retry in lockstep
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+async def with_backoff(call, what: str, max_attempts: int = 5):
+    for attempt in range(max_attempts):
+        try:
+            return await call()
+        except NetworkError as e:
+            if attempt == max_attempts - 1:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"{what} failed ({e}), retrying in {delay:.1f} s. Attempt {attempt + 1}/{max_attempts}")
+            await asyncio.sleep(delay)
+
+async def check_telegram_api(application) -> bool:
+    # Initializing the bot calls get_me, which doubles as the connectivity check
     try:
-        await bot.get_me()
+        await with_backoff(application.initialize, "Connecting to the Telegram API")
         logger.info("Telegram API is responsive.")
         return True
     except Exception as e:
         logger.error(f"Telegram API is not responsive: {e}")
         return False
 
+RECENT_UPDATES_KEY = "recent_updates"
+# Update IDs kept across restarts: a crash can only cause the last getUpdates batch
+# (at most 100 updates) or unanswered webhook calls to be delivered again
+PERSISTED_UPDATE_IDS = 100
+
+async def throttle_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Stop redelivered updates, repeated idempotent commands and commands over the user's rate limit.
+
+    Runs first, so a dropped update never reaches the handlers. The user is told
+    once per cooldown to slow down, and once per accepted command about repeats.
+    """
+    # Handling starts now; dropped here or not, a restart mustn't resume this update
+    journal.done(update.update_id)
+    if throttle.seen_update(update.update_id):
+        logger.info(f"Dropped redelivered update {update.update_id}")
+        raise ApplicationHandlerStop
+    state_store.save(RECENT_UPDATES_KEY, throttle.recent_updates(PERSISTED_UPDATE_IDS))
+    message = update.message
+    user = update.effective_user
+    if user is None or message is None or not message.text or not message.text.startswith('/'):
+        return
+    verdict = throttle.check(user.id, message.text.strip())
+    if verdict is None:
+        return
+    logger.info(f"Dropped {verdict} command {message.text.split()[0]} from user {user.id}")
+    if verdict == THROTTLED:
+        wait = throttle.warn(user.id)
+        if wait is not None:
+            await reply(update, f"You're sending commands too quickly. Please wait {math.ceil(wait)} seconds and try again.")
+    elif throttle.note_duplicate(user.id):
+        await reply(update, f"You just sent {message.text.split()[0]}; the answer above is still current.")
+    raise ApplicationHandlerStop
+
+async def note_first_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    global first_update_seconds
+    if first_update_seconds is None:
+        first_update_seconds = time.monotonic() - STARTED_AT
+        logger.info(f"Time to first update: {first_update_seconds:.2f} s")
+
+async def reply(update: Update, text: str, **kwargs):
+    # Replies jump ahead of group broadcasts in the outbox
+    if update.effective_chat.type != 'private':
+        kwargs.setdefault('reply_to_message_id', update.message.message_id)
+    return await outbox.send_message(update.effective_chat.id, text, priority=REPLY, **kwargs)
+
+async def check_admin(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: Optional[int]) -> bool:
+    """Whether the user administers `chat_id`; replies explaining why not if they don't."""
+    user_id = update.effective_user.id
+    if chat_id is None:
+        await reply(update, "Please send this command in the group chat, or add the game to the command.")
+        return False
+    logger.info(f"Checking admin status for user {user_id} in chat {chat_id}")
+    try:
+        is_admin = await admin_cache.is_admin(context.bot, chat_id, user_id)
+    except Exception as e:
+        logger.error(f"Error checking admin status for user {user_id}: {e}")
+        await reply(update, "An error occurred while checking your permissions. Please try again later.")
+        return False
+    if not is_admin:
+        logger.info(f"User {user_id} is not an admin or owner")
+        await reply(update, "This command is only available to group administrators.")
+    return is_admin
+
 def admin_only(func):
+    """Run a game command only for administrators of the chat of the game it refers to."""
     @wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user_id = update.effective_user.id
-        chat_id = GROUP_CHAT_ID
-        logger.info(f"Checking admin status for user {user_id} in chat {chat_id}")
-        try:
-            user = await context.bot.get_chat_member(chat_id, user_id)
-            logger.info(f"User status: {user.status}")
-            if user.status not in [ChatMember.ADMINISTRATOR, ChatMember.OWNER]:
-                logger.info(f"User {user_id} is not an admin or owner")
-                await update.message.reply_text("This command is only available to group administrators.")
-                return
-            logger.info(f"User {user_id} is an admin or owner, executing command")
+        if await check_admin(update, context, game_chat_id(update, context)):
+            return await func(update, context)
+    return wrapper
+
+def group_admin_only(func):
+    """Run a command only for administrators of the chat it acts on: the group it was sent in, or GROUP_CHAT_ID."""
+    @wraps(func)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        chat = update.effective_chat
+        if await check_admin(update, context, chat.id if chat.type != 'private' else GROUP_CHAT_ID):
             return await func(update, context)
-        except Exception as e:
-            logger.error(f"Error checking admin status for user {user_id}: {e}")
-            await update.message.reply_text("An error occurred while checking your permissions. Please try again later.")
-            return
     return wrapper
 
 def private_chat_only(func):
     @wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if update.effective_chat.type != 'private':
+            # The hint goes to the private chat so the group isn't spammed; only users
+            # who never started the bot get it in the group
             user = update.effective_user
-            await update.message.reply_text(
-                f"Hi @{user.username or user.first_name}! Please send commands in a private chat with me."
-            )
+            command = update.message.text.split()[0].split('@')[0]
+            try:
+                await outbox.send_message(user.id, f"Hi {user.first_name}! Please send {command} here in our private chat, "
+                                                   "or use the buttons under the roster message.", priority=REPLY)
+            except Forbidden:
+                await reply(update, f"Hi @{user.username or user.first_name}! Please use the buttons under the roster message, "
+                                    f"or send commands in a private chat with me: https://t.me/{context.bot.username}")
             return
         return await func(update, context)
     return wrapper
 
+def roster_text(game: Game) -> str:
+    return game.renderer.render(f"Game scheduled for: {game.game_datetime}\n\n")
+
+def make_renderer(game: Game) -> RosterRenderer:
+    return RosterRenderer(game.roster, APPROVE_EMOJI, BALL_EMOJI, OFFER_EMOJI)
+
+def roster_keyboard(game: Game) -> InlineKeyboardMarkup:
+    # Callback data is "<action>:<game key>", well within Telegram's 64 byte limit
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("Join", callback_data=f"join:{game.key}"),
+        InlineKeyboardButton("Leave", callback_data=f"leave:{game.key}"),
+        InlineKeyboardButton(f"Approve {APPROVE_EMOJI}", callback_data=f"approve:{game.key}"),
+        InlineKeyboardButton(f"Ball {BALL_EMOJI}", callback_data=f"ball:{game.key}"),
+    ]])
+
+def make_publisher(game: Game) -> RosterPublisher:
+    return RosterPublisher(game.chat_id, lambda: roster_text(game), outbox, delay=ROSTER_UPDATE_DELAY,
+                           on_new_message=lambda: games.save(game), reply_markup=roster_keyboard(game))
+
+games = GameRegistry(state_store, MAX_PLAYERS, make_publisher, make_renderer)
+# Last game each user worked with in a private chat, by user ID, least recently used first out
+selected_games: "OrderedDict[int, str]" = OrderedDict()
+
+templates = TemplateRegistry(state_store)
+
+# Rating book and match history of a chat, under the chat ID
+RATINGS_KEY_PREFIX = "ratings:"
+MATCH_KEY_PREFIX = "match:"
+# Single rating book of all chats, as saved by older versions
+LEGACY_RATINGS_KEY = "ratings"
+# Final state of games that were cleared or archived after kickoff
+ARCHIVE_KEY_PREFIX = "archive:"
+# Elo ratings and attendance of every player by player name, per chat: each group's admins
+# manage their own players, and /divide_teams only compares players of the same group
+rating_books: Dict[int, RatingBook] = {}
+
+def rating_book(chat_id: int) -> RatingBook:
+    book = rating_books.get(chat_id)
+    if book is None:
+        book = rating_books[chat_id] = RatingBook(k_factor=ELO_K_FACTOR)
+    return book
+
+def save_ratings(chat_id: int) -> None:
+    state_store.save(f"{RATINGS_KEY_PREFIX}{chat_id}", rating_book(chat_id).to_dict())
+
+def match_key(chat_id: int, record: MatchRecord) -> str:
+    return f"{MATCH_KEY_PREFIX}{chat_id}:{record.match_id}"
+
+def load_matches(chat_id: int) -> List[MatchRecord]:
+    return [MatchRecord.from_dict(data) for data in state_store.load_prefix(f"{MATCH_KEY_PREFIX}{chat_id}:").values()]
+
+def migrate_legacy_ratings() -> None:
+    """Give the single rating book of older versions to GROUP_CHAT_ID, the chat it was managed from."""
+    legacy = state_store.load(LEGACY_RATINGS_KEY)
+    # Match keys without a chat ID
+    legacy_matches = {key: data for key, data in state_store.load_prefix(MATCH_KEY_PREFIX).items() if key.count(':') == 1}
+    if legacy is None and not legacy_matches:
+        return
+    if GROUP_CHAT_ID is None:
+        logger.warning("Ratings saved by an older version are kept aside until GROUP_CHAT_ID names their chat")
+        return
+    rating_book(GROUP_CHAT_ID).load(legacy or {})
+    save_ratings(GROUP_CHAT_ID)
+    state_store.delete(LEGACY_RATINGS_KEY)
+    for key, data in legacy_matches.items():
+        state_store.save(match_key(GROUP_CHAT_ID, MatchRecord.from_dict(data)), data)
+        state_store.delete(key)
+    logger.info(f"Moved ratings of {len(legacy or {})} players and {len(legacy_matches)} matches to chat {GROUP_CHAT_ID}")
+
+def roster_sizes():
+    for game in games:
+        yield (('game', game.key), ('list', PLAYING)), len(game.roster.playing)
+        yield (('game', game.key), ('list', WAITING)), len(game.roster.waiting)
+
+metrics.gauge("games_open", "Games that have not been cleared.", lambda: [((), len(games))])
+metrics.gauge("roster_players", "Players on the playing and waiting list of each game.", roster_sizes)
+metrics.gauge("outbox", "Outbox queue depth, totals and latency in seconds.",
+              lambda: [((('stat', name),), value) for name, value in outbox.stats().items()])
+metrics.gauge("admin_cache", "Admin cache hits, misses and cached chats.",
+              lambda: [((('stat', name),), value) for name, value in admin_cache.stats().items()])
+metrics.gauge("throttle", "Throttled users and commands, and updates dropped by reason.",
+              lambda: [((('stat', name),), value) for name, value in throttle.stats().items()])
+metrics.gauge("known_users", "Users in the user directory.", lambda: [((), len(users))])
+metrics.gauge("scheduled_jobs", "Reminders and other timers waiting to fire.", lambda: [((), len(scheduler))])
+metrics.gauge("uptime_seconds", "Seconds since the process started.", lambda: [((), time.monotonic() - STARTED_AT)])
+metrics.gauge("first_update_seconds", "Seconds from process start to the first update.",
+              lambda: [((), first_update_seconds)] if first_update_seconds is not None else [])
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(200, metrics.render().encode(), "text/plain; version=0.0.4; charset=utf-8")
+
+async def log_metrics() -> None:
+    logger.info(f"Metrics summary:\n{metrics.summary() or 'no calls yet'}")
+    scheduler.schedule(time.time() + METRICS_LOG_INTERVAL, ('metrics', 'log'), log_metrics)
+
+def load_state() -> None:
+    started = datetime.now()
+    games.load()
+    templates.load()
+    users.load()
+    throttle.restore_updates(state_store.load(RECENT_UPDATES_KEY) or [])
+    for key, data in state_store.load_prefix(RATINGS_KEY_PREFIX).items():
+        rating_book(int(key[len(RATINGS_KEY_PREFIX):])).load(data)
+    migrate_legacy_ratings()
+    elapsed = (datetime.now() - started).total_seconds() * 1000
+    logger.info(f"Restored state of {len(games)} games in {elapsed:.1f} ms")
+
+def pop_game_key(context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
+    args = context.args or []
+    for i, arg in enumerate(args):
+        key = parse_game_key(arg)
+        if key:
+            del args[i]
+            return key
+    return None
+
+def game_candidates(update: Update, context: ContextTypes.DEFAULT_TYPE) -> List[Game]:
+    """Games a command may refer to, without consuming the game key in its arguments."""
+    key = next(filter(None, map(parse_game_key, context.args or [])), None)
+    chat = update.effective_chat
+    if key is not None:
+        return [games.get(key)] if games.get(key) else []
+    if chat.type != 'private':
+        return games.in_chat(chat.id)
+    user = update.effective_user
+    selected = games.get(selected_games.get(user.id, ""))
+    if selected:
+        return [selected]
+    # Only games the user plays in or of the main group, never other groups' games
+    user_name = user.username or f"{user.first_name}_{user.id}"
+    joined = [game for game in games if user_name in game.roster]
+    return joined or (games.in_chat(GROUP_CHAT_ID) if GROUP_CHAT_ID is not None else [])
+
+def game_chat_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[int]:
+    """Chat a game command acts on: the group it was sent in, else the chat of the game it refers to."""
+    chat = update.effective_chat
+    if chat.type != 'private':
+        return chat.id
+    chat_ids = {game.chat_id for game in game_candidates(update, context)}
+    return chat_ids.pop() if len(chat_ids) == 1 else GROUP_CHAT_ID
+
+async def get_game(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                   no_game_text: str = "No game has been created yet.") -> Optional[Game]:
+    """Find the game a command refers to, or reply explaining why it can't be found.
+
+    An explicit game key in the arguments wins. In a group the chat's only game is
+    used; in a private chat the game the user last worked with, else the games they
+    play in, else the games of GROUP_CHAT_ID.
+    """
+    candidates = game_candidates(update, context)
+    key = pop_game_key(context)
+    chat = update.effective_chat
+
+    if len(candidates) == 1:
+        game = candidates[0]
+        if chat.type == 'private':
+            selected_games[update.effective_user.id] = game.key
+            selected_games.move_to_end(update.effective_user.id)
+            while len(selected_games) > USER_DIRECTORY_SIZE:
+                selected_games.popitem(last=False)
+        return game
+
+    if not candidates and chat.type == 'private' and key is None and len(games):
+        await reply(update, "Please open the game from the link in its group chat, or add the game to the command.")
+    elif not candidates:
+        await reply(update, no_game_text)
+    else:
+        command = update.message.text.split()[0] if update.message and update.message.text else "/register"
+        message = "There are several open games. Please add the game to the command:\n\n"
+        for game in candidates:
+            message += f"{command} {game.key} - {game.game_datetime}\n"
+        await reply(update, message)
+    return None
+
+@instrumented
 @private_chat_only
 async def register(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global game_created
-    if not game_created:
-        await update.message.reply_text("No game has been created yet. Please wait for an admin to create a game.")
+    game = await get_game(update, context, "No game has been created yet. Please wait for an admin to create a game.")
+    if not game:
         return
 
     user = update.effective_user
     user_name = user.username or f"{user.first_name}_{user.id}"
     
-    if user_name in playing_list or user_name in waiting_list:
-        await update.message.reply_text("You're already registered.")
-    elif len(playing_list) < MAX_PLAYERS:
-        playing_list.append(user_name)
-        await update.message.reply_text(f"You've been added to the playing list, {user.first_name}.")
+    added_to = await games.apply(game, game.roster.add, user_name, user.id)
+    if added_to is None:
+        await reply(update, "You're already registered.")
+    elif added_to == PLAYING:
+        await reply(update, f"You've been added to the playing list, {user.first_name}.")
     else:
-        waiting_list.append(user_name)
-        await update.message.reply_text(f"You've been added to the waiting list, {user.first_name}.")
+        await reply(update, f"You've been added to the waiting list, {user.first_name}.")
     
-    logger.info(f"Register command used by {user_name}")
-    await print_list_to_group(context)
+    logger.info(f"Register command used by {user_name} for game {game.key}")
+    await print_list_to_group(context, game)
+
+@instrumented
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Deep links from the game announcement open the private chat with /start <game>
+    if context.args and update.effective_chat.type == 'private':
+        await register(update, context)
+        return
+    await reply(update, "Hi! Use /register in a private chat with me to join a game.")
 
+@instrumented
 @private_chat_only
 async def remove(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global game_created
-    if not game_created:
-        await update.message.reply_text("No game has been created yet.")
+    game = await get_game(update, context)
+    if not game:
         return
     user = update.effective_user
     user_name = user.username or f"{user.first_name}_{user.id}"
     
-    if user_name in playing_list:
-        playing_list.remove(user_name)
-        approvals.pop(user_name, None)
-        bringing_ball.discard(user_name)
-        await update.message.reply_text(f"You've been removed from the playing list, {user.first_name}.")
-        if waiting_list:
-            moved_player = waiting_list.pop(0)
-            playing_list.append(moved_player)
-            await context.bot.send_message(chat_id=GROUP_CHAT_ID, 
-                                           text=f"@{moved_player} has been moved from the waiting list to the playing list.")
-    elif user_name in waiting_list:
-        waiting_list.remove(user_name)
-        await update.message.reply_text(f"You've been removed from the waiting list, {user.first_name}.")
+    removed_from, moved_player = await games.apply(game, game.roster.remove, user_name, offer_deadline(game))
+    if removed_from == PLAYING:
+        await reply(update, f"You've been removed from the playing list, {user.first_name}.")
+        if moved_player:
+            announce_promotion(game, moved_player)
+    elif removed_from == WAITING:
+        await reply(update, f"You've been removed from the waiting list, {user.first_name}.")
     else:
-        await update.message.reply_text("You're not registered for the game.")
+        await reply(update, "You're not registered for the game.")
     
-    logger.info(f"Remove command used by {user_name}")
-    await print_list_to_group(context)
-
-async def print_list_to_group(context: ContextTypes.DEFAULT_TYPE) -> None:
-    global game_created
-    if not game_created:
-        return
-    message = f"Game scheduled for: {game_datetime}\n\n"
-    message += "Playing List:\n"
-    for i, player in enumerate(playing_list, 1):
-        approval_status = f"{APPROVE_EMOJI}" if approvals.get(player, False) else ""
-        ball_status = f"{BALL_EMOJI}" if player in bringing_ball else ""
-        message += f"{i}. @{player} {approval_status}{ball_status}\n"
-    message += "\nWaiting List:\n"
-    for i, player in enumerate(waiting_list, 1):
-        message += f"{i}. @{player}\n"
-    await context.bot.send_message(chat_id=GROUP_CHAT_ID, text=message)
-    logger.info("Print list sent to group chat")
+    logger.info(f"Remove command used by {user_name} for game {game.key}")
+    await print_list_to_group(context, game)
+
+async def print_list_to_group(context: ContextTypes.DEFAULT_TYPE, game: Game) -> None:
+    game.publisher.request_update(context.bot)
 
+@instrumented
 async def print_list_to_group_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await print_list_to_group(context)
+    game = await get_game(update, context)
+    if not game:
+        return
+    await game.publisher.publish(context.bot, repost=True)
     logger.info(f"Print list to group command used by @{update.effective_user.username}")
 
+@instrumented
 @private_chat_only
 async def print_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global game_created, game_datetime
-    if not game_created:
-        await update.message.reply_text("No game has been created yet.")
-        return
-    message = f"Game scheduled for: {game_datetime}\n\n"
-    message += "Playing List:\n"
-    for i, player in enumerate(playing_list, 1):
-        approval_status = f"{APPROVE_EMOJI}" if approvals.get(player, False) else ""
-        ball_status = f"{BALL_EMOJI}" if player in bringing_ball else ""
-        message += f"{i}. @{player} {approval_status}{ball_status}\n"
-    message += "\nWaiting List:\n"
-    for i, player in enumerate(waiting_list, 1):
-        message += f"{i}. @{player}\n"
-    await update.message.reply_text(message)
+    game = await get_game(update, context)
+    if not game:
+        return
+    await reply(update, roster_text(game))
     logger.info(f"Print list command used by @{update.effective_user.username}")
 
+@instrumented
 @private_chat_only
 async def approve(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global game_created
-    if not game_created:
-        await update.message.reply_text("No game has been created yet.")
+    game = await get_game(update, context)
+    if not game:
         return
     user = update.effective_user
     user_name = user.username or f"{user.first_name}_{user.id}"
     
-    if user_name in playing_list:
-        approvals[user_name] = True
-        await update.message.reply_text(f"Your attendance has been approved, {user.first_name}. {APPROVE_EMOJI}")
+    if await games.apply(game, game.roster.approve, user_name):
+        await reply(update, f"Your attendance has been approved, {user.first_name}. {APPROVE_EMOJI}")
     else:
-        await update.message.reply_text("You're not in the playing list.")
+        await reply(update, "You're not in the playing list.")
     logger.info(f"Approve command used by {user_name}")
+    await print_list_to_group(context, game)
 
+@instrumented
+@group_admin_only
 async def create_game(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global playing_list, waiting_list, approvals, bringing_ball, game_created, game_datetime
+    chat = update.effective_chat
+    chat_id = chat.id if chat.type != 'private' else GROUP_CHAT_ID
+    if chat_id is None:
+        await reply(update, "Please use /create_game in the group chat the game is for.")
+        return
 
-    if game_created:
-        await update.message.reply_text("A game has already been created. Use /clear_list to reset everything before creating a new game.")
+    if len(games.in_chat(chat_id)) >= MAX_GAMES_PER_CHAT:
+        await reply(update, f"This chat already has {MAX_GAMES_PER_CHAT} open games. Use /clear_list to remove one before creating a new game.")
         return
 
     if not context.args:
-        await update.message.reply_text("Please provide the day and time for the game. For example: /create_game Sunday 18:00")
+        await reply(update, "Please provide the day and time for the game. For example: /create_game Sunday 18:00")
         return
 
-    game_info = ' '.join(context.args)
-    game_datetime = game_info  # Store the game date and time as a string
-
-    playing_list = []
-    waiting_list = []
-    approvals = {}
-    bringing_ball = set()
-    game_created = True
+    game_datetime = ' '.join(context.args)  # Shown as given; the parsed kickoff drives the reminders
+    kickoff = parse_game_time(game_datetime, GAME_TIMEZONE)
+    if kickoff and kickoff <= datetime.now(GAME_TIMEZONE):
+        await reply(update, "That game time has already passed. For example: /create_game Sunday 18:00 or /create_game 12/05 18:30")
+        return
+    game = games.create(chat_id, game_datetime, kickoff)
+    schedule_game_jobs(game)
     
-    await context.bot.send_message(
-        chat_id=GROUP_CHAT_ID,
-        text=f"New game created for {game_datetime}. Use /register in private to join the game!"
+    outbox.post(
+        chat_id,
+        f"New game created for {game_datetime}. Use /register {game.key} in private to join the game, "
+        f"or open https://t.me/{context.bot.username}?start={game.link_payload}"
     )
     
-    await update.message.reply_text(f"New game created for {game_datetime} and announced in the group chat.")
-    logger.info(f"Create game command used by @{update.effective_user.username} for {game_datetime}")
+    if kickoff:
+        await reply(update, f"New game created for {game_datetime} and announced in the group chat. "
+                            f"Kickoff is {kickoff:%A %d/%m %H:%M}; reminders will go out before it.")
+    else:
+        await reply(update, f"New game created for {game_datetime} and announced in the group chat. "
+                            "Add a time like 18:00 to get automatic reminders.")
+    logger.info(f"Create game command used by @{update.effective_user.username} for {game_datetime} ({game.key})")
 
+@instrumented
+@admin_only
 async def clear_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global playing_list, waiting_list, approvals, bringing_ball, game_created
-    playing_list = []
-    waiting_list = []
-    approvals = {}
-    bringing_ball = set()
-    game_created = False
-    await update.message.reply_text("All lists have been cleared. Use /create_game to start a new game.")
-    logger.info(f"Clear list command used by @{update.effective_user.username}")
+    game = await get_game(update, context)
+    if not game:
+        return
+    if not await archive_game(game):
+        await reply(update, "This game has already been cleared.")
+        return
+    if game.template_id is not None and templates.get(game.chat_id, game.template_id):
+        await reply(update, "All lists have been cleared. The next game from its template has been created.")
+    else:
+        await reply(update, "All lists have been cleared. Use /create_game to start a new game.")
+    logger.info(f"Clear list command used by @{update.effective_user.username} for game {game.key}")
     
+@instrumented
 @private_chat_only
 async def bring_ball(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global game_created
-    if not game_created:
-        await update.message.reply_text("No game has been created yet.")
+    game = await get_game(update, context)
+    if not game:
         return
     user = update.effective_user
     user_name = user.username or f"{user.first_name}_{user.id}"
     
-    if user_name in playing_list:
-        if user_name in bringing_ball:
-            bringing_ball.remove(user_name)
-            await update.message.reply_text(f"{user.first_name}, we've noted that you're no longer bringing a ball.")
-        else:
-            bringing_ball.add(user_name)
-            await update.message.reply_text(f"Great, {user.first_name}! We've noted that you're bringing a ball. {BALL_EMOJI}")
+    bringing = await games.apply(game, game.roster.toggle_ball, user_name)
+    if bringing is False:
+        await reply(update, f"{user.first_name}, we've noted that you're no longer bringing a ball.")
+    elif bringing:
+        await reply(update, f"Great, {user.first_name}! We've noted that you're bringing a ball. {BALL_EMOJI}")
     else:
-        await update.message.reply_text("You're not in the playing list. Please register for the game first.")
+        await reply(update, "You're not in the playing list. Please register for the game first.")
     logger.info(f"Bring ball command used by {user_name}")
+    await print_list_to_group(context, game)
+
+@instrumented
+async def roster_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Join/Leave/Approve/Ball buttons under the roster message.
+
+    The tap is answered with a toast instead of a chat message, and the roster
+    message is edited by the publisher like after any other change.
+    """
+    query = update.callback_query
+    action, _, key = query.data.partition(':')
+    game = games.get(key)
+    if game is None:
+        await query.answer("This game has been cleared.", show_alert=True)
+        return
 
+    user = update.effective_user
+    user_name = user.username or f"{user.first_name}_{user.id}"
+    try:
+        if action == 'join':
+            added_to = await games.apply(game, game.roster.add, user_name, user.id)
+            if added_to is None:
+                text = "You're already registered."
+            elif added_to == PLAYING:
+                text = "You've been added to the playing list."
+            else:
+                text = "The game is full, you've been added to the waiting list."
+        elif action == 'leave':
+            removed_from, moved_player = await games.apply(game, game.roster.remove, user_name, offer_deadline(game))
+            if removed_from is None:
+                text = "You're not registered for the game."
+            else:
+                text = f"You've been removed from the {removed_from} list."
+            if moved_player:
+                announce_promotion(game, moved_player)
+        elif action == 'approve':
+            approved = await games.apply(game, game.roster.approve, user_name)
+            text = f"Your attendance has been approved. {APPROVE_EMOJI}" if approved else "You're not in the playing list."
+        elif action == 'ball':
+            bringing = await games.apply(game, game.roster.toggle_ball, user_name)
+            if bringing is None:
+                text = "You're not in the playing list. Please join the game first."
+            else:
+                text = f"Noted, you're bringing a ball. {BALL_EMOJI}" if bringing else "Noted, you're no longer bringing a ball."
+        else:
+            text = "Unknown action."
+    except GameClosed:
+        # Cleared between the lookup above and the change
+        await query.answer("This game has been cleared.", show_alert=True)
+        return
+
+    # Not a chat message, so it doesn't count against the outbox's rate limits
+    await query.answer(text)
+    logger.info(f"Roster button {action} used by {user_name} for game {game.key}")
+    await print_list_to_group(context, game)
+
+@instrumented
 @private_chat_only
+@admin_only
 async def register_player(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    game = await get_game(update, context)
+    if not game:
+        return
     if not context.args:
-        await update.message.reply_text("Please provide a username to register.")
+        await reply(update, "Please provide a username to register.")
         return
     
     username = context.args[0].lstrip('@')
-    if username in playing_list or username in waiting_list:
-        await update.message.reply_text(f"@{username} is already registered.")
-    elif len(playing_list) < MAX_PLAYERS:
-        playing_list.append(username)
-        await update.message.reply_text(f"@{username} has been added to the playing list.")
+    # A user the bot has seen is registered under their current name and linked to their ID
+    known = users.find(username)
+    if known:
+        username = known.player_name
+    added_to = await games.apply(game, game.roster.add, username, known.user_id if known else None)
+    if added_to is None:
+        await reply(update, f"@{username} is already registered.")
+    elif added_to == PLAYING:
+        await reply(update, f"@{username} has been added to the playing list.")
     else:
-        waiting_list.append(username)
-        await update.message.reply_text(f"@{username} has been added to the waiting list.")
+        await reply(update, f"@{username} has been added to the waiting list.")
     
     logger.info(f"Register player command used for @{username}")
     
     # Print the updated list to the group chat
-    await print_list_to_group(context)
+    await print_list_to_group(context, game)
 
+@instrumented
 @private_chat_only
+@admin_only
 async def remove_player(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    game = await get_game(update, context)
+    if not game:
+        return
     if not context.args:
-        await update.message.reply_text("Please provide a username to remove.")
+        await reply(update, "Please provide a username to remove.")
         return
     
     username = context.args[0].lstrip('@')
-    if username in playing_list:
-        playing_list.remove(username)
-        approvals.pop(username, None)
-        bringing_ball.discard(username)
-        await update.message.reply_text(f"@{username} has been removed from the playing list.")
-        if waiting_list:
-            moved_player = waiting_list.pop(0)
-            playing_list.append(moved_player)
-            await context.bot.send_message(
-                chat_id=GROUP_CHAT_ID, 
-                text=f"@{moved_player} has been moved from the waiting list to the playing list."
-            )
-    elif username in waiting_list:
-        waiting_list.remove(username)
-        await update.message.reply_text(f"@{username} has been removed from the waiting list.")
+    known = users.find(username)
+    if username not in game.roster and known:
+        username = known.player_name
+    removed_from, moved_player = await games.apply(game, game.roster.remove, username, offer_deadline(game))
+    if removed_from == PLAYING:
+        await reply(update, f"@{username} has been removed from the playing list.")
+        if moved_player:
+            announce_promotion(game, moved_player)
+    elif removed_from == WAITING:
+        await reply(update, f"@{username} has been removed from the waiting list.")
     else:
-        await update.message.reply_text(f"@{username} is not registered for the game.")
+        await reply(update, f"@{username} is not registered for the game.")
     
     logger.info(f"Remove player command used for @{username}")
+    await print_list_to_group(context, game)
+
+async def note_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    if user is None or user.is_bot:
+        return
+    previous = users.observe(user.id, user.username, user.first_name)
+    if previous is not None:
+        await rename_player(user.id, previous, users.get(user.id).player_name)
+
+async def rename_player(user_id: int, old: str, new: str) -> None:
+    """Follow a user's new username in rosters, team pairings and teams, templates and ratings."""
+    for game in games:
+        entry = game.roster.get(old)
+        if not game.mentions(old) or (entry is not None and entry.user_id not in (None, user_id)):
+            continue
+        try:
+            if not await games.apply(game, game.rename, old, new):
+                continue
+        except GameClosed:
+            continue
+        entry = game.roster.get(new) if entry is not None else None
+        if entry is not None:
+            entry.user_id = user_id
+            if entry.offer_deadline:
+                scheduler.cancel((game.key, 'offer', old))
+                scheduler.schedule(entry.offer_deadline, (game.key, 'offer', new), expire_offer, game, new)
+        logger.info(f"Renamed @{old} to @{new} in game {game.key}")
+        game.publisher.request_update(outbox.bot)
+
+    for template in templates:
+        if old in template.core_players and new not in template.core_players:
+            template.core_players = [new if name == old else name for name in template.core_players]
+            templates.save(template)
+            logger.info(f"Renamed @{old} to @{new} in the core players of template {template.key}")
+
+    for chat_id, book in rating_books.items():
+        if not book.rename(old, new):
+            continue
+        save_ratings(chat_id)
+        # Renames are rare, and /recompute_ratings replays the history under the new name
+        for record in load_matches(chat_id):
+            if record.rename(old, new):
+                state_store.save(match_key(chat_id, record), record.to_dict())
+        logger.info(f"Renamed @{old} to @{new} in the ratings of chat {chat_id}")
+
+def player_user_id(player) -> Optional[int]:
+    # Players an admin registered by username are linked once the user is seen
+    if player.user_id:
+        return player.user_id
+    known = users.find(player.name)
+    return known.user_id if known else None
+
+def schedule_reminders(game: Game) -> None:
+    """Schedule the reminders of a game that are still due, relative to its kickoff.
+
+    Reminders missed while the bot was down are skipped, except the latest one
+    if kickoff is still ahead.
+    """
+    if game.kickoff is None:
+        return
+    now = datetime.now(GAME_TIMEZONE)
+    if game.kickoff <= now:
+        return
+    pending = [hours for hours in REMINDER_HOURS if hours not in game.reminders_sent]
+    missed = [hours for hours in pending if game.kickoff - timedelta(hours=hours) <= now]
+    for hours in pending:
+        if missed and hours > missed[-1]:
+            continue
+        when = (game.kickoff - timedelta(hours=hours)).timestamp()
+        scheduler.schedule(when, (game.key, 'reminder', hours), send_reminder, game, hours)
+
+async def remind_privately(game: Game) -> Tuple[DeliveryReport, list]:
+    """Send each unapproved player a private reminder.
+
+    Returns the delivery report by player name and the players without a known
+    private chat, i.e. those an admin registered who never used the bot.
+    """
+    recipients, unknown = {}, []
+    for player in game.roster.playing.values():
+        if player.approved:
+            continue
+        user_id = player_user_id(player)
+        if user_id:
+            recipients[player.name] = user_id
+        else:
+            unknown.append(player.name)
+    message = (f"Reminder: Please approve your attendance for the game on {game.game_datetime}. "
+               f"Send /approve {game.key} to confirm, or /remove {game.key} if you can't make it.")
+    started = datetime.now()
+    report = await outbox.fan_out(recipients, message, concurrency=DM_FANOUT_CONCURRENCY)
+    elapsed = (datetime.now() - started).total_seconds()
+    logger.info(f"Private reminders for game {game.key}: {report}, {len(unknown)} unknown, in {elapsed:.1f} s")
+    return report, unknown
+
+def delivery_summary(game: Game, report: DeliveryReport, unknown: list) -> str:
+    message = f"Private reminders for the game on {game.game_datetime}: {report}."
+    if report.blocked:
+        message += "\n\nBlocked the bot or never started it:\n" + "\n".join(f"@{name}" for name in report.blocked)
+    if report.failed:
+        message += "\n\nCould not be delivered:\n" + "\n".join(f"@{name}" for name in report.failed)
+    if unknown:
+        message += "\n\nNo private chat known (registered by an admin):\n" + "\n".join(f"@{name}" for name in unknown)
+    return message
+
+# Background jobs started by handlers, kept so they aren't garbage collected
+background_tasks = set()
+
+def run_in_background(coroutine) -> None:
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def send_reminder(game: Game, hours: float) -> None:
+    if game.closed:
+        return
+    # Earlier reminders that were skipped count as sent too
+    sent = [h for h in REMINDER_HOURS if h >= hours and h not in game.reminders_sent]
+    await games.apply(game, game.reminders_sent.extend, sent)
+    unapproved = game.roster.unapproved()
+    if not unapproved:
+        return
+    if REMINDER_MODE in ('dm', 'both'):
+        await remind_privately(game)
+        if REMINDER_MODE == 'dm':
+            return
+    # From the actual time left: a missed reminder fires late, e.g. for a game created shortly before kickoff
+    minutes = max(1, round((game.kickoff - datetime.now(GAME_TIMEZONE)).total_seconds() / 60))
+    if minutes >= 90:
+        starts_in = f"{round(minutes / 60)} hours"
+    else:
+        starts_in = f"{minutes} minute{'s' if minutes != 1 else ''}"
+    message = f"Reminder: The game on {game.game_datetime} starts in {starts_in}. Please approve your attendance. Use the /approve command in a private chat with me.\n\n"
+    for player in unapproved:
+        message += f"@{player}\n"
+    try:
+        await outbox.send_message(game.chat_id, message)
+        logger.info(f"Automatic reminder sent for game {game.key}, {starts_in} before kickoff")
+    except telegram.error.TelegramError as e:
+        logger.error(f"Failed to send reminder for game {game.key}: {e}")
+
+def offer_deadline(game: Game) -> Optional[float]:
+    """Deadline for a waiting player promoted now, never later than kickoff."""
+    if PROMOTION_CONFIRM_MINUTES <= 0:
+        return None
+    deadline = time.time() + PROMOTION_CONFIRM_MINUTES * 60
+    if game.kickoff is not None:
+        deadline = min(deadline, game.kickoff.timestamp())
+    return deadline if deadline > time.time() else None
+
+def schedule_game_jobs(game: Game) -> None:
+    """Schedule everything time-based for a game: reminders, offer deadlines and the release cutoff.
+
+    Offers are kept in the roster, so after a restart their deadlines are scheduled
+    again from the saved state; deadlines that passed meanwhile fire right away.
+    """
+    schedule_reminders(game)
+    for player in game.roster.playing.values():
+        if player.offer_deadline:
+            scheduler.schedule(player.offer_deadline, (game.key, 'offer', player.name), expire_offer, game, player.name)
+    if game.kickoff is not None and RELEASE_UNAPPROVED_HOURS > 0 and not game.unapproved_released:
+        cutoff = (game.kickoff - timedelta(hours=RELEASE_UNAPPROVED_HOURS)).timestamp()
+        if game.kickoff.timestamp() > time.time():
+            scheduler.schedule(cutoff, (game.key, 'release'), release_unapproved, game)
+    if game.kickoff is not None and game.template_id is not None:
+        archive_at = (game.kickoff + timedelta(hours=GAME_ARCHIVE_HOURS)).timestamp()
+        scheduler.schedule(archive_at, (game.key, 'archive'), archive_game, game)
+
+async def notify_player(game: Game, name: str, user_id: Optional[int], text: str) -> None:
+    # Privately if possible, otherwise by mentioning them in the group
+    if user_id:
+        try:
+            await outbox.send_message(user_id, text)
+            return
+        except telegram.error.TelegramError:
+            pass
+    await outbox.send_message(game.chat_id, f"@{name} {text}")
+
+def announce_promotion(game: Game, player) -> None:
+    if player.offer_deadline is None:
+        outbox.post(game.chat_id, f"@{player.name} has been moved from the waiting list to the playing list.")
+        return
+    # Lazily cancelled: if the player approves or leaves first, the expiry finds nothing to do
+    scheduler.schedule(player.offer_deadline, (game.key, 'offer', player.name), expire_offer, game, player.name)
+    until = datetime.fromtimestamp(player.offer_deadline, GAME_TIMEZONE)
+    run_in_background(notify_player(game, player.name, player_user_id(player),
+        f"A spot opened up in the game on {game.game_datetime}! It's yours if you confirm by {until:%H:%M}: "
+        f"send /approve {game.key} to me privately or tap Approve under the roster."))
+    logger.info(f"Offered a spot in game {game.key} to {player.name} until {until:%H:%M}")
+
+async def expire_offer(game: Game, name: str) -> None:
+    if game.closed:
+        return
+    entry = game.roster.get(name)
+    expired, promoted = await games.apply(game, game.roster.expire_offer, name, offer_deadline(game))
+    if not expired:
+        return
+    run_in_background(notify_player(game, name, player_user_id(entry),
+        f"Your spot offer for the game on {game.game_datetime} expired, so you've been taken off the list. "
+        f"Send /register {game.key} if you can still make it."))
+    logger.info(f"Offer to {name} in game {game.key} expired, next up: {promoted.name if promoted else 'nobody'}")
+    if promoted:
+        announce_promotion(game, promoted)
+    game.publisher.request_update(outbox.bot)
+
+async def release_unapproved(game: Game) -> None:
+    if game.closed:
+        return
+    def release(deadline: Optional[float]):
+        game.unapproved_released = True
+        return game.roster.release_unapproved(deadline)
 
-async def send_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
-    now = datetime.now(pytz.timezone('Asia/Jerusalem'))
-    if now.weekday() == 6:  # Sunday (0 is Monday, 6 is Sunday)
-        unapproved = [player for player in playing_list if player not in approvals]
-        if unapproved:
-            message = "Reminder: Please approve your attendance for this week's game. Use the /approve command in a private chat with me.\n\n"
-            for player in unapproved:
-                message += f"@{player}\n"
-            await context.bot.send_message(chat_id=GROUP_CHAT_ID, text=message)
-            logger.info("Automatic reminder sent")
+    released, promoted = await games.apply(game, release, offer_deadline(game))
+    if not released:
+        return
+    logger.info(f"Released {len(released)} unapproved players from game {game.key}, promoted {len(promoted)}")
+    message = (f"The game on {game.game_datetime} starts soon. These players didn't approve their attendance "
+               "and have been removed to make room for the waiting list:\n\n")
+    message += "\n".join(f"@{name}" for name in released)
+    outbox.post(game.chat_id, message)
+    for player in promoted:
+        announce_promotion(game, player)
+    game.publisher.request_update(outbox.bot)
+
+async def archive_game(game: Game) -> bool:
+    """Close a game, keep its final roster under ARCHIVE_KEY_PREFIX and open the next game of its template."""
+    try:
+        await games.close(game, f"{ARCHIVE_KEY_PREFIX}{game.key}:{int(time.time() * 1000)}")
+    except GameClosed:
+        return False
+    scheduler.cancel_group(game.key)
+    logger.info(f"Archived game {game.key} ({game.game_datetime}) with {len(game.roster.playing)} players")
+    template = templates.get(game.chat_id, game.template_id) if game.template_id is not None else None
+    if template is not None and template.game_key == game.key:
+        await open_next_game(template)
+    return True
+
+async def open_next_game(template: GameTemplate) -> Optional[Game]:
+    """Create the next game of a template with its core players already registered.
+
+    The core players are added in one roster change, so the roster is saved and
+    published once instead of once per player.
+    """
+    after = datetime.now(GAME_TIMEZONE)
+    if template.last_kickoff and template.last_kickoff > after:
+        after = template.last_kickoff
+    if len(games.in_chat(template.chat_id)) >= MAX_GAMES_PER_CHAT:
+        logger.error(f"Chat {template.chat_id} has {MAX_GAMES_PER_CHAT} open games, not opening template {template.key}")
+        return None
+    kickoff = template.next_kickoff(GAME_TIMEZONE, after)
+    game = games.create(template.chat_id, template.game_datetime(kickoff), kickoff, template.capacity, template.template_id)
+    registered = await games.apply(game, game.roster.add_many, template.core_players)
+    template.game_key = game.key
+    template.last_kickoff = kickoff
+    templates.save(template)
+    schedule_game_jobs(game)
 
+    message = f"New game created for {game.game_datetime}. "
+    if registered:
+        message += f"The {registered} regular players are already registered. "
+    message += (f"Use /register {game.key} in private to join the game, "
+                f"or open https://t.me/{outbox.bot.username}?start={game.link_payload}")
+    outbox.post(game.chat_id, message)
+    game.publisher.request_update(outbox.bot)
+    logger.info(f"Opened game {game.key} for {game.game_datetime} from template {template.key} "
+                f"with {registered} core players")
+    return game
+
+async def open_template_games() -> None:
+    # Templates whose game is missing, e.g. because the bot was down when it was due
+    for template in templates:
+        game = games.get(template.game_key) if template.game_key else None
+        if game is None or game.template_id != template.template_id:
+            await open_next_game(template)
+
+def template_chat_id(update: Update) -> Optional[int]:
+    chat = update.effective_chat
+    return chat.id if chat.type != 'private' else GROUP_CHAT_ID
+
+async def get_template(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[GameTemplate]:
+    chat_id = template_chat_id(update)
+    arg = context.args[0] if context.args else ""
+    template = templates.get(chat_id, int(arg)) if arg.isdigit() else None
+    if template is None:
+        await reply(update, "Please provide the number of a template. Use /templates to see them.")
+    return template
+
+@instrumented
+@group_admin_only
+async def create_template(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = template_chat_id(update)
+    if chat_id is None:
+        await reply(update, "Please use /create_template in the group chat the games are for.")
+        return
+    usage = "Please provide the weekday and time of the weekly game, and optionally the player limit and location. For example: /create_template Sunday 18:00 14 City Park"
+    args = context.args or []
+    kickoff = parse_game_time(' '.join(args[:2]), GAME_TIMEZONE) if len(args) >= 2 else None
+    if kickoff is None:
+        await reply(update, usage)
+        return
+    rest = args[2:]
+    capacity = None
+    if rest and rest[0].isdigit():
+        capacity = int(rest.pop(0))
+        if capacity < 1:
+            await reply(update, usage)
+            return
+    if rest and rest[0].lower() == "at":
+        rest = rest[1:]
+
+    template = templates.create(chat_id, kickoff.weekday(), kickoff.time().replace(second=0, microsecond=0),
+                                capacity, ' '.join(rest))
+    game = await open_next_game(template)
+    message = f"Template {template.template_id} created: every {template.label}"
+    message += f", {capacity} players." if capacity else "."
+    if game:
+        message += f" The first game is on {game.game_datetime}."
+    message += f" Use /core_players {template.template_id} @player ... to register the regulars automatically."
+    await reply(update, message)
+    logger.info(f"Create template command used by @{update.effective_user.username} for {template.label} ({template.key})")
+
+@instrumented
+@group_admin_only
+async def core_players(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    template = await get_template(update, context)
+    if not template:
+        return
+    names = [name.lstrip('@') for name in context.args[1:]]
+    if not names:
+        if template.core_players:
+            await reply(update, f"Regular players of {template.label}:\n\n" + "\n".join(f"@{name}" for name in template.core_players))
+        else:
+            await reply(update, f"{template.label} has no regular players yet. For example: /core_players {template.template_id} @player1 @player2")
+        return
+
+    template.core_players = list(dict.fromkeys(names))
+    templates.save(template)
+    message = f"{len(template.core_players)} regular players set for {template.label}."
+    game = games.get(template.game_key) if template.game_key else None
+    if game is not None and game.template_id == template.template_id:
+        added = await games.apply(game, game.roster.add_many, template.core_players)
+        game.publisher.request_update(context.bot)
+        message += f" {added} of them were added to the game on {game.game_datetime}."
+    await reply(update, message)
+    logger.info(f"Core players command used by @{update.effective_user.username} for template {template.key}")
+
+@instrumented
+async def list_templates(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = template_chat_id(update)
+    chat_templates = templates.in_chat(chat_id)
+    if not chat_templates:
+        await reply(update, "There are no game templates yet. Create one with /create_template Sunday 18:00")
+        return
+    message = "Weekly games:\n\n"
+    for template in chat_templates:
+        limit = template.capacity or MAX_PLAYERS
+        message += f"{template.template_id}. {template.label}, {limit} players, {len(template.core_players)} regulars\n"
+    await reply(update, message)
+
+@instrumented
+@group_admin_only
+async def delete_template(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    template = await get_template(update, context)
+    if not template:
+        return
+    templates.remove(template)
+    await reply(update, f"Template {template.template_id} ({template.label}) deleted. Its open game stays until it is cleared.")
+    logger.info(f"Delete template command used by @{update.effective_user.username} for template {template.key}")
+
+@instrumented
+@admin_only
 async def manual_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global game_created, GROUP_CHAT_ID
-    
-    if not game_created:
-        await update.message.reply_text("No game has been created yet. Please create a game first.")
+    game = await get_game(update, context, "No game has been created yet. Please create a game first.")
+    if not game:
         return
 
-    unapproved = [player for player in playing_list if player not in approvals]
+    mode = context.args[0].lower() if context.args else 'group'
+    if mode not in REMINDER_MODES:
+        await reply(update, "Please choose where to send the reminder: /send_reminder group, /send_reminder dm or /send_reminder both")
+        return
+    unapproved = game.roster.unapproved()
     
-    if not playing_list:
-        await update.message.reply_text("There are no players registered for the game yet.")
+    if not game.roster.playing:
+        await reply(update, "There are no players registered for the game yet.")
         return
     
     if not unapproved:
-        await update.message.reply_text("All registered players have already approved their attendance.")
+        await reply(update, "All registered players have already approved their attendance.")
         return
 
+    if mode in ('dm', 'both'):
+        chat_id = update.effective_chat.id
+
+        async def fan_out_and_report() -> None:
+            # Runs in the background: hundreds of private messages take a while at Telegram's rate limits
+            report, unknown = await remind_privately(game)
+            outbox.post(chat_id, delivery_summary(game, report, unknown), priority=REPLY)
+
+        run_in_background(fan_out_and_report())
+        await reply(update, f"Sending private reminders to {len(unapproved)} players. I'll report back when they're delivered.")
+        logger.info(f"Manual private reminder command used by @{update.effective_user.username}")
+        if mode == 'dm':
+            return
+
     message = "Reminder: Please approve your attendance for the upcoming game. Use the /approve command in a private chat with me.\n\n"
     message += "Players who haven't approved yet:\n"
     for player in unapproved:
         message += f"@{player}\n"
 
     try:
-        await context.bot.send_message(chat_id=GROUP_CHAT_ID, text=message)
-        await update.message.reply_text("Reminder sent to the group chat successfully.")
+        await outbox.send_message(game.chat_id, message)
+        await reply(update, "Reminder sent to the group chat successfully.")
     except telegram.error.TelegramError as e:
         logger.error(f"Failed to send reminder to group chat: {e}")
-        await update.message.reply_text("Failed to send reminder to the group chat. Please check the bot's permissions.")
+        await reply(update, "Failed to send reminder to the group chat. Please check the bot's permissions.")
 
     logger.info(f"Manual reminder command used by @{update.effective_user.username}")
 
+@instrumented
 @private_chat_only
+@admin_only
 async def divide_teams(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if len(playing_list) < 9:
-        await update.message.reply_text("Not enough players to divide into teams. At least 9 players are needed.")
+    game = await get_game(update, context)
+    if not game:
+        return
+    team_count = int(context.args[0]) if context.args and context.args[0].isdigit() else TEAM_COUNT
+    if team_count < 2:
+        await reply(update, "Please divide the players into at least 2 teams.")
+        return
+    if len(game.roster.playing) < 3 * team_count:
+        await reply(update, f"Not enough players to divide into teams. At least {3 * team_count} players are needed.")
         return
     
-    random.shuffle(playing_list)
-    team_size = len(playing_list) // 3
-    team1 = playing_list[:team_size]
-    team2 = playing_list[team_size:2*team_size]
-    team3 = playing_list[2*team_size:]
+    split = balance_teams(
+        game.roster.playing_names(),
+        rating_book(game.chat_id),
+        team_count,
+        ball_bringers=[player.name for player in game.roster.playing.values() if player.bringing_ball],
+        together=game.together,
+        apart=game.apart,
+        time_budget=TEAM_BALANCE_TIME_BUDGET,
+    )
     
     message = "Teams have been divided as follows:\n\n"
-    message += "Team 1 (Starts playing):\n" + "\n".join(f"@{player}" for player in team1) + "\n\n"
-    message += "Team 2 (Starts playing):\n" + "\n".join(f"@{player}" for player in team2) + "\n\n"
-    message += "Team 3 (Starts on the bench):\n" + "\n".join(f"@{player}" for player in team3) + "\n\n"
-    message += "Team 3 will start on the bench and rotate in. Good luck and have fun!"
+    for i, team in enumerate(split.teams, 1):
+        status = "Starts playing" if i <= 2 else "Starts on the bench"
+        message += f"Team {i} ({status}):\n" + "\n".join(f"@{player}" for player in team) + "\n\n"
+    bench = [str(i) for i in range(3, team_count + 1)]
+    if len(bench) == 1:
+        message += f"Team {bench[0]} will start on the bench and rotate in. "
+    elif bench:
+        message += f"Teams {', '.join(bench)} will start on the bench and rotate in. "
+    message += "Good luck and have fun!"
     
-    await context.bot.send_message(chat_id=GROUP_CHAT_ID, text=message)
-    logger.info(f"Divide teams command used by @{update.effective_user.username}")
+    await games.apply(game, setattr, game, "teams", split.teams)
+    outbox.post(game.chat_id, message)
+    logger.info(f"Divide teams command used by @{update.effective_user.username}: {team_count} teams, "
+                f"rating spread {split.spread:.1f}, {split.violations} broken constraints, "
+                f"{split.iterations} iterations in {split.elapsed * 1000:.1f} ms")
 
-def private_chat_only(func):
-    @wraps(func)
-    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if update.effective_chat.type != 'private':
-            user = update.effective_user
-            await update.message.reply_text(
-                f"Hi @{user.username or user.first_name}! Please send commands in a private chat with me."
-            )
-            return
-        return await func(update, context)
-    return wrapper
+@instrumented
+@private_chat_only
+@admin_only
+async def set_rating(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Ratings belong to the chat of the game the command refers to, which admin_only checked
+    chat_id = game_chat_id(update, context)
+    pop_game_key(context)
+    try:
+        username = context.args[0].lstrip('@')
+        rating = float(context.args[1])
+        if not math.isfinite(rating):
+            # nan or inf would spoil every Elo expectation the player is part of
+            raise ValueError(context.args[1])
+    except (IndexError, ValueError):
+        await reply(update, f"Please provide a username and a rating. For example: /set_rating @player {DEFAULT_RATING:.0f}")
+        return
+    rating_book(chat_id).set_base(username, rating)
+    save_ratings(chat_id)
+    await reply(update, f"@{username} now has a rating of {rating:.0f}.")
+    logger.info(f"Set rating command used by @{update.effective_user.username} for @{username}")
+
+@instrumented
+@private_chat_only
+@admin_only
+async def record_result(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    game = await get_game(update, context)
+    if not game:
+        return
+    if not game.teams:
+        await reply(update, "There are no teams to record a result for. Use /divide_teams first.")
+        return
+    result = context.args[0].lower() if context.args else ""
+    if result == "draw":
+        winner = None
+    elif result.isdigit() and 1 <= int(result) <= len(game.teams):
+        winner = int(result) - 1
+    else:
+        await reply(update, f"Please provide the winning team (1-{len(game.teams)}) or 'draw', followed by any players who didn't show up. For example: /record_result 2 @player")
+        return
+    absent = [name.lstrip('@') for name in context.args[1:]]
+
+    teams = game.teams
+    await games.apply(game, setattr, game, "teams", None)
+    record = rating_book(game.chat_id).record(teams, winner, absent)
+    state_store.save(match_key(game.chat_id, record), record.to_dict())
+    save_ratings(game.chat_id)
 
+    outcome = "The game ended in a draw" if winner is None else f"Team {winner + 1} won"
+    await reply(update, f"{outcome}. Ratings of {len(record.deltas)} players have been updated.")
+    logger.info(f"Record result command used by @{update.effective_user.username} for game {game.key}: {result}")
+
+@instrumented
+@private_chat_only
+async def player_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    chat_id = game_chat_id(update, context)
+    if chat_id is None:
+        await reply(update, "Please add the game to the command, so I know which group's stats to show.")
+        return
+    pop_game_key(context)
+    username = context.args[0].lstrip('@') if context.args else (user.username or f"{user.first_name}_{user.id}")
+    stats = rating_books[chat_id].stats(username) if chat_id in rating_books else None
+    if stats is None:
+        await reply(update, f"There are no recorded games for @{username} yet.")
+        return
+    await reply(update,
+        f"@{username}\n"
+        f"Rating: {stats.rating:.0f}\n"
+        f"Games: {stats.games} ({stats.wins} won, {stats.draws} drawn, {stats.losses} lost)\n"
+        f"Win rate: {stats.win_rate:.0%}\n"
+        f"Attendance: {stats.attendance_rate:.0%} ({stats.no_shows} no-shows)"
+    )
+    logger.info(f"Stats command used by @{user.username} for @{username}")
+
+@instrumented
+@private_chat_only
+@admin_only
+async def recompute_ratings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = game_chat_id(update, context)
+    started = datetime.now()
+    records = load_matches(chat_id)
+    count = rating_book(chat_id).replay(records)
+    for record in records:
+        state_store.save(match_key(chat_id, record), record.to_dict())
+    save_ratings(chat_id)
+    elapsed = (datetime.now() - started).total_seconds() * 1000
+    await reply(update, f"Ratings recomputed from {count} recorded games.")
+    logger.info(f"Recompute ratings command used by @{update.effective_user.username}: {count} games in {elapsed:.1f} ms")
+
+async def add_team_constraint(update: Update, context: ContextTypes.DEFAULT_TYPE, together: bool) -> None:
+    game = await get_game(update, context)
+    if not game:
+        return
+    if not context.args or len(context.args) < 2:
+        await reply(update, "Please provide two usernames.")
+        return
+    pair = (context.args[0].lstrip('@'), context.args[1].lstrip('@'))
+    pairs = game.together if together else game.apart
+    await games.apply(game, pairs.append, pair)
+    where = "on the same team" if together else "on different teams"
+    await reply(update, f"@{pair[0]} and @{pair[1]} will be put {where} by /divide_teams.")
+    logger.info(f"Team constraint added by @{update.effective_user.username}: {pair} {where}")
+
+@instrumented
+@private_chat_only
+@admin_only
+async def keep_together(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await add_team_constraint(update, context, together=True)
+
+@instrumented
+@private_chat_only
+@admin_only
+async def keep_apart(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await add_team_constraint(update, context, together=False)
+
+@instrumented
 async def get_chat_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     chat_type = update.effective_chat.type
     if chat_type == 'private':
-        await update.message.reply_text(f"This private chat ID is: {chat_id}")
+        await reply(update, f"This private chat ID is: {chat_id}")
     else:
-        await update.message.reply_text(f"This {chat_type} chat ID is: {chat_id}")
+        await reply(update, f"This {chat_type} chat ID is: {chat_id}")
     logger.info(f"Get chat ID command used by @{update.effective_user.username} in {chat_type} chat")
 
-async def set_commands_with_retry(bot, max_retries=3):
+COMMANDS_HASH_KEY = "commands_hash"
+
+async def set_commands(bot) -> None:
+    """Publish the command list, unless this exact list was already published for this bot."""
     commands = [
         BotCommand("register", "Register for the game"),
         BotCommand("remove", "Remove yourself from the game"),
@@ -388,25 +1299,43 @@ async def set_commands_with_retry(bot, max_retries=3):
         BotCommand("approve", "Approve your attendance"),
         BotCommand("create_game", "Create a new game and reset lists"),
         BotCommand("clear_list", "Clear all lists"),
-        BotCommand("send_reminder", "Manually send a reminder"),
+        BotCommand("create_template", "Create a weekly game that opens by itself"),
+        BotCommand("core_players", "Set the regulars registered for every game of a template"),
+        BotCommand("templates", "List the weekly game templates"),
+        BotCommand("delete_template", "Stop creating games from a template"),
+        BotCommand("send_reminder", "Manually send a reminder (group, dm or both)"),
         BotCommand("get_chat_id", "Get the chat ID"),
         BotCommand("bring_ball", "Indicate you're bringing a ball"),
         BotCommand("register_player", "Admin: Register another player"),
         BotCommand("remove_player", "Admin: Remove another player"),
         BotCommand("divide_teams", "Admin: Divide players into teams"),
+        BotCommand("set_rating", "Admin: Set a player's rating for team balancing"),
+        BotCommand("record_result", "Admin: Record which team won"),
+        BotCommand("stats", "Show a player's rating and attendance"),
+        BotCommand("recompute_ratings", "Admin: Recompute ratings from all results"),
+        BotCommand("keep_together", "Admin: Put two players on the same team"),
+        BotCommand("keep_apart", "Admin: Put two players on different teams"),
     ]
-    for attempt in range(max_retries):
-        try:
-            await bot.set_my_commands(commands)
-            logger.info("Bot commands set successfully")
-            return
-        except TimedOut:
-            logger.warning(f"Timed out while setting bot commands. Attempt {attempt + 1}/{max_retries}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(5)
-    logger.error("Failed to set bot commands after maximum retries")
+    bot_id = BOT_TOKEN.split(':')[0]
+    listing = json.dumps([bot_id] + [[command.command, command.description] for command in commands])
+    commands_hash = hashlib.sha256(listing.encode()).hexdigest()
+    if state_store.load(COMMANDS_HASH_KEY) == commands_hash:
+        logger.info("Bot commands are unchanged, not setting them again")
+        return
+    try:
+        await with_backoff(lambda: bot.set_my_commands(commands), "Setting bot commands")
+        state_store.save(COMMANDS_HASH_KEY, commands_hash)
+        logger.info("Bot commands set successfully")
+    except Exception as e:
+        logger.error(f"Failed to set bot commands: {e}")
 
+@instrumented
 async def send_welcome_message(update: ChatMemberUpdated, context: ContextTypes.DEFAULT_TYPE) -> None:
+    old_status, new_status = update.chat_member.old_chat_member.status, update.chat_member.new_chat_member.status
+    if old_status != new_status and (old_status in ADMIN_STATUSES or new_status in ADMIN_STATUSES):
+        # Promotions and demotions take effect on the next admin command
+        admin_cache.invalidate(update.chat_member.chat.id)
+
     result = extract_status_change(update.chat_member)
     if result is None:
         return
@@ -427,11 +1356,12 @@ async def send_welcome_message(update: ChatMemberUpdated, context: ContextTypes.
             "Enjoy the games and have fun! If you have any questions, feel free to ask in the group."
         )
         try:
-            await context.bot.send_message(chat_id=user.id, text=welcome_message)
+            await outbox.send_message(user.id, welcome_message, priority=REPLY)
             logger.info(f"Welcome message sent to new member @{user.username or user.first_name}")
         except Exception as e:
             logger.error(f"Failed to send welcome message to @{user.username or user.first_name}: {e}")
-            await update.effective_chat.send_message(
+            outbox.post(
+                update.effective_chat.id,
                 f"Welcome {user.mention_html()}!\n\n"
             "Here are the rules and how to use the bot:\n\n"
             "1. Games are typically are posted by admins a week before.\n"
@@ -473,64 +1403,154 @@ def extract_status_change(chat_member_update: ChatMemberUpdated) -> Optional[Tup
 
     return was_member, is_member
 
-async def main():
-    if not check_internet_connection():
-        logger.error("Cannot start bot due to no internet connection.")
+def install_signal_handlers(stop_event: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Not available on Windows, where Ctrl+C still raises KeyboardInterrupt
+            pass
+
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if isinstance(context.error, GameClosed) and isinstance(update, Update) and update.message:
+        await reply(update, "This game has been cleared in the meantime. Use /print_list to see the open games.")
         return
+    logger.error(f"Exception while handling an update: {context.error}")
+
+def build_application():
+    """Create the Application with all handlers, talking to BOT_API_URL."""
+    base_url, base_file_url = f"{BOT_API_URL}/bot", f"{BOT_API_URL}/file/bot"
+    if BOT_MODE == 'webhook':
+        bot = WebhookBot(BOT_TOKEN, base_url=base_url, base_file_url=base_file_url,
+                         request=InstrumentedRequest(connection_pool_size=256))
+        builder = ApplicationBuilder().bot(bot).updater(None)
+    else:
+        builder = (ApplicationBuilder().token(BOT_TOKEN).base_url(base_url).base_file_url(base_file_url)
+                   .request(InstrumentedRequest(connection_pool_size=256))
+                   .get_updates_request(InstrumentedRequest()))
+    # Reminders run on our own scheduler, so the job queue's scheduler needn't start
+    builder.job_queue(None)
+    builder.update_queue(JournaledQueue(journal))
+    if CONCURRENT_UPDATES > 1:
+        # Roster changes go through games.apply, which serializes them per game
+        builder.concurrent_updates(CONCURRENT_UPDATES)
+    application = builder.build()
+
+    # Run before every other handler; negative groups don't stop the update from reaching them,
+    # unless throttle_update raises ApplicationHandlerStop
+    application.add_handler(TypeHandler(Update, throttle_update), group=-3)
+    application.add_handler(TypeHandler(Update, note_user), group=-2)
+    application.add_handler(TypeHandler(Update, note_first_update), group=-1)
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("register", register))
+    application.add_handler(CommandHandler("remove", remove))
+    application.add_handler(CommandHandler("print_list", print_list))
+    application.add_handler(CommandHandler("print_list_to_group", print_list_to_group_command))
+    application.add_handler(CommandHandler("approve", approve))
+    application.add_handler(CommandHandler("create_game", create_game))
+    application.add_handler(CommandHandler("clear_list", clear_list))
+    application.add_handler(CommandHandler("create_template", create_template))
+    application.add_handler(CommandHandler("core_players", core_players))
+    application.add_handler(CommandHandler("templates", list_templates))
+    application.add_handler(CommandHandler("delete_template", delete_template))
+    application.add_handler(CommandHandler("send_reminder", manual_reminder))
+    application.add_handler(CommandHandler("get_chat_id", get_chat_id))
+    application.add_handler(CommandHandler("bring_ball", bring_ball))
+    application.add_handler(CommandHandler("register_player", register_player))
+    application.add_handler(CommandHandler("remove_player", remove_player))
+    application.add_handler(CommandHandler("divide_teams", divide_teams))
+    application.add_handler(CommandHandler("set_rating", set_rating))
+    application.add_handler(CommandHandler("record_result", record_result))
+    application.add_handler(CommandHandler("stats", player_stats))
+    application.add_handler(CommandHandler("recompute_ratings", recompute_ratings))
+    application.add_handler(CommandHandler("keep_together", keep_together))
+    application.add_handler(CommandHandler("keep_apart", keep_apart))
+    application.add_handler(CallbackQueryHandler(roster_button, pattern=r"^(join|leave|approve|ball):"))
+    application.add_handler(ChatMemberHandler(send_welcome_message, ChatMemberHandler.CHAT_MEMBER))
 
+    application.add_error_handler(error_handler)
+    return application
+
+async def take_over_state() -> None:
+    # Blocks while a previous process still drains and saves its state
+    await state_store.acquire()
+    load_state()
+    await state_store.start()
+
+async def drain(timeout: float) -> None:
+    """Finish in-flight background jobs and publish pending roster edits before the outbox stops."""
+    if background_tasks:
+        _, pending = await asyncio.wait(set(background_tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Cancelled {len(pending)} background jobs still running at shutdown")
+    for game in games:
+        try:
+            await game.publisher.flush(outbox.bot)
+        except Exception as e:
+            logger.error(f"Failed to publish the roster of game {game.key}: {e}")
+
+async def main(stop_event: Optional[asyncio.Event] = None) -> bool:
+    """Run the bot until `stop_event` is set or SIGINT/SIGTERM arrives.
+
+    Stopping is graceful: no new updates are taken, the ones already received are
+    handled, queued messages are sent and the state is written before the state
+    store is handed to the next process. Returns False if the bot failed to start
+    without being asked to stop.
+    """
     logger.info(f"Starting bot with token: {BOT_TOKEN[:5]}...")
     application = None
+    receiver = None
+    metrics_server = None
+    started = False
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        install_signal_handlers(stop_event)
     try:
-        application = ApplicationBuilder().token(BOT_TOKEN).build()
+        application = build_application()
+        await outbox.start(application.bot)
+        await scheduler.start()
+        if METRICS_LOG_INTERVAL > 0:
+            scheduler.schedule(time.time() + METRICS_LOG_INTERVAL, ('metrics', 'log'), log_metrics)
+        if METRICS_PORT is not None:
+            metrics_server = HTTPServer(METRICS_HOST, METRICS_PORT)
+            metrics_server.route('GET', '/metrics', metrics_endpoint)
+            await metrics_server.start()
 
-        if not await check_telegram_api(application.bot):
+        # get_me, set_my_commands and waiting for the previous process are independent,
+        # so during a deploy the API round trips overlap with the old process shutting down
+        api_ready, _, _ = await asyncio.gather(check_telegram_api(application), set_commands(application.bot),
+                                               take_over_state())
+        if not api_ready:
             logger.error("Cannot start bot due to Telegram API issues.")
-            return
-        
-        application.add_handler(CommandHandler("register", register))
-        application.add_handler(CommandHandler("remove", remove))
-        application.add_handler(CommandHandler("print_list", print_list))
-        application.add_handler(CommandHandler("print_list_to_group", print_list_to_group_command))
-        application.add_handler(CommandHandler("approve", approve))
-        application.add_handler(CommandHandler("create_game", create_game))
-        application.add_handler(CommandHandler("clear_list", clear_list))
-        application.add_handler(CommandHandler("send_reminder", manual_reminder))
-        application.add_handler(CommandHandler("get_chat_id", get_chat_id))
-        application.add_handler(CommandHandler("bring_ball", bring_ball))
-        application.add_handler(CommandHandler("register_player", register_player))
-        application.add_handler(CommandHandler("remove_player", remove_player))
-        application.add_handler(CommandHandler("divide_teams", divide_teams))
-        application.add_handler(ChatMemberHandler(send_welcome_message, ChatMemberHandler.CHAT_MEMBER))
-
-        await set_commands_with_retry(application.bot)
-
-        if application.job_queue:
-            # Schedule reminders for Sundays between 2 PM and 6 PM
-            for hour in range(14, 18):
-                application.job_queue.run_daily(
-                    send_reminders,
-                    time=time(hour=hour, minute=0, tzinfo=pytz.timezone('Asia/Jerusalem')),
-                    days=(6,)  # 6 is Sunday
-                )
-            logger.info("Job queue set up successfully for Sunday reminders")
-        else:
-            logger.warning("Job queue is not available. Reminders will not be sent automatically.")
+            return False
+        for game in games:
+            schedule_game_jobs(game)
+        logger.info(f"Scheduled {len(scheduler)} reminders and promotion deadlines")
 
-        logger.info("Bot started successfully")
-        await application.initialize()
         await application.start()
-        
-        async def error_handler(update, context):
-            logger.error(f"Exception while handling an update: {context.error}")
+        pending = journal.pending(application.bot)
+        for update in pending:
+            await application.update_queue.put(update)
+        if pending:
+            logger.info(f"Resuming {len(pending)} updates received before the restart")
+        await open_template_games()
 
-        application.add_error_handler(error_handler)
+        # Updates that arrived while no process was running are delivered now, not dropped
+        if BOT_MODE == 'webhook':
+            receiver = WebhookReceiver(application, HTTPServer(port=PORT), WEBHOOK_PATH, WEBHOOK_SECRET, journal)
+            await receiver.start(WEBHOOK_URL, allowed_updates=ALLOWED_UPDATES, drop_pending_updates=False)
+            logger.info(f"Bot is receiving updates by webhook on port {PORT}...")
+        else:
+            await application.updater.start_polling(allowed_updates=ALLOWED_UPDATES, drop_pending_updates=False)
+            logger.info("Bot is polling for updates...")
+        started = True
+        logger.info(f"Bot started successfully in {time.monotonic() - STARTED_AT:.2f} s")
 
-        await application.updater.start_polling(allowed_updates=['message', 'chat_member'], 
-                                                drop_pending_updates=True)
-        logger.info("Bot is polling for updates...")
-        
-        while True:
-            await asyncio.sleep(1)
+        await stop_event.wait()
+        logger.info("Stop signal received, shutting down...")
 
     except NetworkError as e:
         logger.error(f"Network error occurred: {e}")
@@ -539,30 +1559,51 @@ async def main():
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
     finally:
+        stopping = time.monotonic()
+        # Stop taking updates first; the polling updater acknowledges what it fetched
+        if receiver:
+            await receiver.stop(SHUTDOWN_TIMEOUT)
         if application:
             try:
-                await application.stop()
+                if application.updater and application.updater.running:
+                    await application.updater.stop()
+                if application.running:
+                    # Handles every update already queued and waits for running handlers
+                    await application.stop()
+                await scheduler.stop(SHUTDOWN_TIMEOUT)
+                await drain(SHUTDOWN_TIMEOUT)
+                await outbox.stop(timeout=SHUTDOWN_TIMEOUT)
                 await application.shutdown()
                 logger.info("Application has been stopped and shut down.")
             except Exception as e:
                 logger.error(f"Error during application shutdown: {e}")
+        if metrics_server:
+            await metrics_server.stop()
+        try:
+            await state_store.close()
+            logger.info(f"Game state saved, shut down in {time.monotonic() - stopping:.2f} s")
+        except Exception as e:
+            logger.error(f"Error saving game state: {e}")
+    return started or stop_event.is_set()
 
 if __name__ == '__main__':
+    # Only a failed start is retried, e.g. while the network is down; after a stop signal the process exits
     retry_count = 0
     max_retries = 5
     while retry_count < max_retries:
         try:
-            asyncio.run(main())
-            break
+            if asyncio.run(main()):
+                break
         except KeyboardInterrupt:
             logger.info("Bot stopped manually")
             break
         except Exception as e:
             logger.error(f"Unhandled exception: {e}")
-            retry_count += 1
-            logger.info(f"Retrying in 10 seconds... (Attempt {retry_count}/{max_retries})")
-            import time
-            time.sleep(10)
-    
+        retry_count += 1
+        delay = backoff_delay(retry_count, base=2, cap=60)
+        logger.info(f"Retrying in {delay:.1f} seconds... (Attempt {retry_count}/{max_retries})")
+        time.sleep(delay)
+
     if retry_count == max_retries:
-        logger.error("Max retries reached. Bot could not be started.")
\ No newline at end of file
+        logger.error("Max retries reached. Bot could not be started.")
+        sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: no handoff between processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_DELETED = object()
+
+
+def _build(value):
+    return value() if callable(value) else value
+
+
+class StateStore:
+    """Write-behind key/value store on top of SQLite in WAL mode.
+
+    `save` only records the latest value of a key in memory; a background task
+    writes all pending keys in a single transaction on a dedicated thread, so
+    handlers never wait for the disk. A value can be given as a callable that
+    builds it, so a key saved many times between flushes is serialized once.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.2):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._conn = None
+        self._pending: Dict[str, object] = {}
+        # Created on first use and again after close, so a store can be started again
+        self._executor = None
+        self._wakeup = None
+        self._flusher = None
+        self._lock_file = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.commit()
+        return self._conn
+
+    async def acquire(self, poll_interval: float = 0.1) -> None:
+        """Wait until no other process uses the store, then hold it until `close`.
+
+        During a deploy the new process waits here while the old one drains and
+        writes its last state, so no state is loaded before it is final.
+        """
+        if fcntl is None:
+            return
+        self._lock_file = open(self.path + ".lock", "w")
+        waiting = False
+        while True:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if not waiting:
+                    logger.info(f"Waiting for the previous process to hand over {self.path}")
+                    waiting = True
+                await asyncio.sleep(poll_interval)
+        if waiting:
+            logger.info(f"Took over {self.path}")
+
+    def load(self, key: str) -> Optional[dict]:
+        if key in self._pending:
+            value = self._pending[key]
+            return None if value is _DELETED else _build(value)
+        row = self._connect().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_prefix(self, prefix: str) -> Dict[str, dict]:
+        rows = self._connect().execute(
+            "SELECT key, value FROM kv WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff")
+        ).fetchall()
+        result = {key: json.loads(value) for key, value in rows}
+        for key, value in self._pending.items():
+            if key.startswith(prefix):
+                if value is _DELETED:
+                    result.pop(key, None)
+                else:
+                    result[key] = _build(value)
+        return result
+
+    def save(self, key: str, value: Union[dict, Callable[[], dict]]) -> None:
+        self._pending[key] = value
+        self._schedule_flush()
+
+    def delete(self, key: str) -> None:
+        self._pending[key] = _DELETED
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        if self._pending:
+            self._wakeup.set()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to write state to {self.path}: {e}")
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        # Built here, on the event loop, so the values can't change while they are written
+        batch = {key: _build(value) for key, value in self._pending.items()}
+        self._pending = {}
+        try:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write_batch, batch)
+        except Exception:
+            # Keep anything saved meanwhile, it is newer than the failed batch
+            batch.update(self._pending)
+            self._pending = batch
+            raise
+
+    def _write_batch(self, batch: Dict[str, object]) -> None:
+        started = time.perf_counter()
+        conn = self._connect()
+        with conn:
+            for key, value in batch.items():
+                if value is _DELETED:
+                    conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+                else:
+                    conn.execute(
+                        "INSERT INTO kv (key, value) VALUES (?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                        (key, json.dumps(value)),
+                    )
+        logger.debug(f"Wrote {len(batch)} state keys in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._lock_file is not None:
+            # Closing the file releases the lock for the next process
+            self._lock_file.close()
+            self._lock_file = None
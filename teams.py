@@ -0,0 +1,180 @@
+import random
+import time
+from typing import Iterable, List, Optional, Protocol, Sequence, Tuple
+
+from ratings import DEFAULT_RATING
+
+# Weight of one broken together/apart constraint or misplaced ball, in rating points squared
+CONSTRAINT_WEIGHT = 1e9
+
+
+class TeamSplit:
+    __slots__ = ("teams", "totals", "violations", "iterations", "elapsed")
+
+    def __init__(self, teams: List[List[str]], totals: List[float], violations: int, iterations: int, elapsed: float):
+        self.teams = teams
+        self.totals = totals
+        self.violations = violations
+        self.iterations = iterations
+        self.elapsed = elapsed
+
+    @property
+    def spread(self) -> float:
+        """Difference between the strongest and the weakest team's average rating."""
+        averages = [total / len(team) for team, total in zip(self.teams, self.totals) if team]
+        return max(averages) - min(averages) if averages else 0.0
+
+
+class Ratings(Protocol):
+    """Ratings by player name, e.g. a dict or a RatingBook."""
+
+    def get(self, name: str, default: float) -> Optional[float]:
+        ...
+
+
+def team_sizes(player_count: int, team_count: int) -> List[int]:
+    base, extra = divmod(player_count, team_count)
+    return [base + (1 if i < extra else 0) for i in range(team_count)]
+
+
+def balance_teams(players: Sequence[str], ratings: Ratings, team_count: int,
+                  ball_bringers: Iterable[str] = (), together: Iterable[Tuple[str, str]] = (),
+                  apart: Iterable[Tuple[str, str]] = (), time_budget: float = 0.05,
+                  seed: Optional[int] = None) -> TeamSplit:
+    """Split players into `team_count` teams of (almost) equal size and strength.
+
+    Starts from a snake draft by rating and improves it with randomized
+    pairwise swaps until `time_budget` seconds have passed, restarting from a
+    perturbed copy of the best split whenever the search gets stuck. Each swap
+    is scored incrementally, so large pools stay fast. Ball bringers are spread
+    evenly and together/apart pairs are soft constraints with a large weight.
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    n = len(players)
+    index = {name: i for i, name in enumerate(players)}
+    rating = [float(ratings.get(name, DEFAULT_RATING)) for name in players]
+    balls = [False] * n
+    for name in ball_bringers:
+        if name in index:
+            balls[index[name]] = True
+    links: List[List[Tuple[int, bool]]] = [[] for _ in range(n)]
+    for pairs, same in ((together, True), (apart, False)):
+        for a, b in pairs:
+            if a in index and b in index and a != b:
+                links[index[a]].append((index[b], same))
+                links[index[b]].append((index[a], same))
+
+    sizes = team_sizes(n, team_count)
+    total_rating = sum(rating)
+    targets = [total_rating * size / n if n else 0.0 for size in sizes]
+    ball_count = sum(balls)
+    ball_low, ball_high = ball_count // team_count, -(-ball_count // team_count)
+
+    # Snake draft: strongest players go round-robin, reversing direction each round
+    order = sorted(range(n), key=lambda i: rating[i], reverse=True)
+    assignment = [0] * n
+    filled = [0] * team_count
+    snake = list(range(team_count)) + list(reversed(range(team_count)))
+    step = 0
+    for i in order:
+        while filled[snake[step % len(snake)]] >= sizes[snake[step % len(snake)]]:
+            step += 1
+        team = snake[step % len(snake)]
+        assignment[i] = team
+        filled[team] += 1
+        step += 1
+
+    totals = [0.0] * team_count
+    ball_totals = [0] * team_count
+
+    def load(new_assignment: List[int]) -> None:
+        assignment[:] = new_assignment
+        totals[:] = [0.0] * team_count
+        ball_totals[:] = [0] * team_count
+        for i in range(n):
+            totals[assignment[i]] += rating[i]
+            ball_totals[assignment[i]] += balls[i]
+
+    load(assignment)
+
+    def ball_penalty(count: int) -> int:
+        return max(0, count - ball_high) + max(0, ball_low - count)
+
+    def link_penalty(i: int, team: int, other: int, other_team: int) -> int:
+        # Broken constraints of player i if placed in `team`; `other` is moved to `other_team`
+        broken = 0
+        for j, same in links[i]:
+            j_team = other_team if j == other else assignment[j]
+            if (j_team == team) != same:
+                broken += 1
+        return broken
+
+    def cost_and_violations() -> Tuple[float, int]:
+        violations = sum(ball_penalty(count) for count in ball_totals)
+        violations += sum(link_penalty(i, assignment[i], -1, -1) for i in range(n)) // 2
+        spread = sum((total - target) ** 2 for total, target in zip(totals, targets))
+        return spread + CONSTRAINT_WEIGHT * violations, violations
+
+    def swap_delta(p: int, q: int) -> float:
+        x, y = assignment[p], assignment[q]
+        diff = rating[q] - rating[p]
+        delta = ((totals[x] + diff - targets[x]) ** 2 - (totals[x] - targets[x]) ** 2
+                 + (totals[y] - diff - targets[y]) ** 2 - (totals[y] - targets[y]) ** 2)
+        if balls[p] != balls[q]:
+            moved = balls[q] - balls[p]
+            delta += CONSTRAINT_WEIGHT * (ball_penalty(ball_totals[x] + moved) - ball_penalty(ball_totals[x])
+                                          + ball_penalty(ball_totals[y] - moved) - ball_penalty(ball_totals[y]))
+        if links[p] or links[q]:
+            before = link_penalty(p, x, q, y) + link_penalty(q, y, p, x)
+            after = link_penalty(p, y, q, x) + link_penalty(q, x, p, y)
+            delta += CONSTRAINT_WEIGHT * (after - before)
+        return delta
+
+    def swap(p: int, q: int) -> None:
+        x, y = assignment[p], assignment[q]
+        diff = rating[q] - rating[p]
+        totals[x] += diff
+        totals[y] -= diff
+        ball_totals[x] += balls[q] - balls[p]
+        ball_totals[y] += balls[p] - balls[q]
+        assignment[p], assignment[q] = y, x
+
+    cost, _ = cost_and_violations()
+    best_cost, best_assignment = cost, assignment[:]
+    iterations = 0
+    stale = 0
+    deadline = started + time_budget
+    while n > 1 and team_count > 1:
+        iterations += 1
+        if iterations % 256 == 0 and time.perf_counter() >= deadline:
+            break
+        p, q = rng.randrange(n), rng.randrange(n)
+        if assignment[p] != assignment[q]:
+            delta = swap_delta(p, q)
+            if delta < -1e-9:
+                swap(p, q)
+                cost += delta
+                stale = 0
+                if cost < best_cost - 1e-9:
+                    best_cost, best_assignment = cost, assignment[:]
+                continue
+        stale += 1
+        if best_cost < 1e-9:
+            break
+        if stale > 20 * n:
+            # Stuck in a local optimum: restart from a perturbed copy of the best split
+            load(best_assignment)
+            for _ in range(max(1, n // 10)):
+                p, q = rng.randrange(n), rng.randrange(n)
+                if assignment[p] != assignment[q]:
+                    swap(p, q)
+            cost, _ = cost_and_violations()
+            stale = 0
+
+    load(best_assignment)
+    teams: List[List[str]] = [[] for _ in range(team_count)]
+    for i in range(n):
+        teams[assignment[i]].append(players[i])
+    _, violations = cost_and_violations()
+    return TeamSplit(teams, totals, violations, iterations, time.perf_counter() - started)
@@ -0,0 +1,117 @@
+import logging
+from datetime import datetime, time, timedelta
+from typing import Dict, List, Optional
+
+from games import WEEKDAYS
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_KEY_PREFIX = "template:"
+
+
+class GameTemplate:
+    """A weekly game slot of a chat, from which the next game is created automatically."""
+
+    __slots__ = ("chat_id", "template_id", "weekday", "clock", "capacity", "location", "core_players",
+                 "game_key", "last_kickoff")
+
+    def __init__(self, chat_id: int, template_id: int, weekday: int, clock: time,
+                 capacity: Optional[int] = None, location: str = ""):
+        self.chat_id = chat_id
+        self.template_id = template_id
+        self.weekday = weekday
+        self.clock = clock
+        # Player limit of the games, None for MAX_PLAYERS
+        self.capacity = capacity
+        self.location = location
+        # Regulars registered in bulk when a game is created
+        self.core_players: List[str] = []
+        # Key of the open game created from this template, if any
+        self.game_key = None
+        # Kickoff of the latest game created, so a week is never created twice
+        self.last_kickoff: Optional[datetime] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.chat_id}:{self.template_id}"
+
+    @property
+    def label(self) -> str:
+        label = f"{WEEKDAYS[self.weekday].title()} {self.clock:%H:%M}"
+        return f"{label} at {self.location}" if self.location else label
+
+    def next_kickoff(self, tz, after: datetime) -> datetime:
+        """First kickoff of this slot after `after`, in the pytz timezone `tz`."""
+        after = after.astimezone(tz)
+        day = after.date() + timedelta(days=(self.weekday - after.weekday()) % 7)
+        kickoff = tz.localize(datetime.combine(day, self.clock))
+        if kickoff <= after:
+            kickoff = tz.localize(datetime.combine(day + timedelta(days=7), self.clock))
+        return kickoff
+
+    def game_datetime(self, kickoff: datetime) -> str:
+        text = f"{kickoff:%A %d/%m %H:%M}"
+        return f"{text} at {self.location}" if self.location else text
+
+    def to_dict(self) -> dict:
+        return {
+            "chat_id": self.chat_id,
+            "template_id": self.template_id,
+            "weekday": self.weekday,
+            "clock": self.clock.strftime("%H:%M"),
+            "capacity": self.capacity,
+            "location": self.location,
+            "core_players": list(self.core_players),
+            "game_key": self.game_key,
+            "last_kickoff": self.last_kickoff.isoformat() if self.last_kickoff else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GameTemplate":
+        template = cls(data["chat_id"], data["template_id"], data["weekday"],
+                       datetime.strptime(data["clock"], "%H:%M").time(), data.get("capacity"), data.get("location", ""))
+        template.core_players = data.get("core_players", [])
+        template.game_key = data.get("game_key")
+        template.last_kickoff = datetime.fromisoformat(data["last_kickoff"]) if data.get("last_kickoff") else None
+        return template
+
+
+class TemplateRegistry:
+    """Game templates of all chats, keyed by chat ID and template ID within the chat."""
+
+    def __init__(self, store):
+        self.store = store
+        self.templates: Dict[str, GameTemplate] = {}
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def __iter__(self):
+        return iter(list(self.templates.values()))
+
+    def get(self, chat_id: int, template_id: int) -> Optional[GameTemplate]:
+        return self.templates.get(f"{chat_id}:{template_id}")
+
+    def in_chat(self, chat_id: int) -> List[GameTemplate]:
+        return sorted((t for t in self.templates.values() if t.chat_id == chat_id), key=lambda t: t.template_id)
+
+    def create(self, chat_id: int, weekday: int, clock: time, capacity: Optional[int] = None,
+               location: str = "") -> GameTemplate:
+        template_id = max((t.template_id for t in self.in_chat(chat_id)), default=0) + 1
+        template = GameTemplate(chat_id, template_id, weekday, clock, capacity, location)
+        self.templates[template.key] = template
+        self.save(template)
+        return template
+
+    def remove(self, template: GameTemplate) -> None:
+        self.templates.pop(template.key, None)
+        self.store.delete(TEMPLATE_KEY_PREFIX + template.key)
+
+    def save(self, template: GameTemplate) -> None:
+        self.store.save(TEMPLATE_KEY_PREFIX + template.key, template.to_dict())
+
+    def load(self) -> None:
+        for data in self.store.load_prefix(TEMPLATE_KEY_PREFIX).values():
+            template = GameTemplate.from_dict(data)
+            self.templates[template.key] = template
+        logger.info(f"Loaded {len(self.templates)} game templates")
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+import pytz
+
+from games import parse_game_key, parse_game_time
+
+TZ = pytz.timezone("Europe/Berlin")
+# A Wednesday
+NOW = TZ.localize(datetime(2026, 10, 14, 12, 0))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Sunday 18:00", datetime(2026, 10, 18, 18, 0)),
+    ("sun 18:00", datetime(2026, 10, 18, 18, 0)),
+    ("Sunday 18.00", datetime(2026, 10, 18, 18, 0)),
+    ("Sunday at 6pm", datetime(2026, 10, 18, 18, 0)),
+    ("Wednesday 11:00", datetime(2026, 10, 21, 11, 0)),
+    ("Sunday 10.12", datetime(2026, 10, 18, 10, 12)),
+    ("20.30", datetime(2026, 10, 14, 20, 30)),
+    ("11:00", datetime(2026, 10, 15, 11, 0)),
+    ("tomorrow 8pm", datetime(2026, 10, 15, 20, 0)),
+    ("today 12am", datetime(2026, 10, 14, 0, 0)),
+    ("tonight 21:15", datetime(2026, 10, 14, 21, 15)),
+    ("12/05 18:30", datetime(2027, 5, 12, 18, 30)),
+    ("12.05 18.30", datetime(2027, 5, 12, 18, 30)),
+    ("10.12 18:00", datetime(2026, 12, 10, 18, 0)),
+    ("10.12.2026 18.00", datetime(2026, 12, 10, 18, 0)),
+    ("2026-11-01 18:00", datetime(2026, 11, 1, 18, 0)),
+    ("Sunday 01/11/2026 18:00", datetime(2026, 11, 1, 18, 0)),
+    ("Monday 01/11/2026 18:00", None),
+    ("Sunday", None),
+    ("Sunday 25:00", None),
+    ("13pm", None),
+    ("31/02 18:00", None),
+    ("after work", None),
+])
+def test_parse_game_time(text, expected):
+    kickoff = parse_game_time(text, TZ, NOW)
+    if expected is None:
+        assert kickoff is None
+    else:
+        assert kickoff == TZ.localize(expected)
+
+
+def test_parse_game_key_accepts_deep_link_form():
+    assert parse_game_key("-100:2") == "-100:2"
+    assert parse_game_key("-100_2") == "-100:2"
+    assert parse_game_key("Sunday") is None
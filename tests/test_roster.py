@@ -0,0 +1,73 @@
+import pytest
+
+from roster import PLAYING, WAITING, Roster
+
+
+def make_roster(max_players, playing, waiting=()):
+    roster = Roster(max_players)
+    roster.add_many(list(playing) + list(waiting))
+    return roster
+
+
+@pytest.mark.parametrize("name, removed_from, promoted, playing, waiting", [
+    ("a", PLAYING, "d", ["b", "c", "d"], ["e"]),
+    ("c", PLAYING, "d", ["a", "b", "d"], ["e"]),
+    ("e", WAITING, None, ["a", "b", "c"], ["d"]),
+    ("x", None, None, ["a", "b", "c"], ["d", "e"]),
+])
+def test_remove(name, removed_from, promoted, playing, waiting):
+    roster = make_roster(3, "abc", "de")
+    result, entry = roster.remove(name, offer_deadline=100.0)
+    assert result == removed_from
+    assert (entry.name if entry else None) == promoted
+    assert roster.playing_names() == playing
+    assert roster.waiting_names() == waiting
+    if entry:
+        assert entry.offer_deadline == 100.0
+
+
+def test_expire_offer_passes_the_slot_on():
+    roster = make_roster(2, "ab", "cd")
+    _, offered = roster.remove("a", offer_deadline=100.0)
+    assert offered.name == "c"
+
+    expired, promoted = roster.expire_offer("c", offer_deadline=200.0)
+    assert expired
+    assert promoted.name == "d" and promoted.offer_deadline == 200.0
+    assert "c" not in roster
+    assert roster.playing_names() == ["b", "d"]
+
+
+@pytest.mark.parametrize("setup", ["approved", "not_on_offer", "unknown"])
+def test_expire_offer_keeps_players_without_an_open_offer(setup):
+    roster = make_roster(2, "ab", "c")
+    if setup == "approved":
+        roster.playing["a"].offer_deadline = 100.0
+        roster.approve("a")
+    name = "x" if setup == "unknown" else "a"
+    assert roster.expire_offer(name) == (False, None)
+    assert roster.playing_names() == ["a", "b"]
+
+
+@pytest.mark.parametrize("waiting, released, playing", [
+    ("", [], ["a", "b", "c"]),
+    ("d", ["c"], ["a", "b", "d"]),
+    ("de", ["c", "b"], ["a", "d", "e"]),
+    ("defg", ["c", "b"], ["a", "d", "e"]),
+])
+def test_release_unapproved_makes_room_only_for_waiting_players(waiting, released, playing):
+    roster = make_roster(3, "abc", waiting)
+    roster.approve("a")
+    names, promoted = roster.release_unapproved()
+    assert names == released
+    assert [entry.name for entry in promoted] == list(waiting[:len(released)])
+    assert roster.playing_names() == playing
+
+
+def test_release_unapproved_spares_open_offers():
+    roster = make_roster(2, "ab", "cd")
+    roster.remove("a", offer_deadline=100.0)
+    names, promoted = roster.release_unapproved()
+    assert names == ["b"]
+    assert [entry.name for entry in promoted] == ["d"]
+    assert roster.playing_names() == ["c", "d"]
@@ -0,0 +1,68 @@
+import pytest
+
+from throttle import DUPLICATE, THROTTLED, Throttle
+
+
+def make_throttle():
+    # One command per second after a burst of three; /print_list repeats within 5 s are dropped
+    return Throttle(rate=1, burst=3, duplicate_window=5, idempotent={"/print_list"})
+
+
+@pytest.mark.parametrize("commands, verdicts", [
+    # Toggles and non-idempotent repeats run as sent
+    ([(0, "/bring_ball"), (0.1, "/bring_ball")], [None, None]),
+    ([(0, "/register"), (0.1, "/remove"), (0.2, "/register")], [None, None, None]),
+    # An idempotent repeat is dropped, unless another command came in between
+    ([(0, "/print_list"), (0.1, "/print_list")], [None, DUPLICATE]),
+    ([(0, "/print_list"), (0.1, "/approve"), (0.2, "/print_list")], [None, None, None]),
+    ([(0, "/print_list"), (5, "/print_list")], [None, None]),
+    ([(0, "/print_list@bot"), (0.1, "/print_list@bot")], [None, DUPLICATE]),
+    # The burst is spent, then a token comes back every second
+    ([(0, "/a"), (0, "/b"), (0, "/c"), (0, "/d"), (1, "/e")], [None, None, None, THROTTLED, None]),
+])
+def test_check(commands, verdicts):
+    throttle = make_throttle()
+    assert [throttle.check(1, text, now=now) for now, text in commands] == verdicts
+
+
+def test_duplicates_cost_no_token():
+    throttle = make_throttle()
+    assert throttle.check(1, "/print_list", now=0) is None
+    for _ in range(10):
+        assert throttle.check(1, "/print_list", now=0) == DUPLICATE
+    assert throttle.check(1, "/a", now=0) is None
+    assert throttle.check(1, "/b", now=0) is None
+
+
+def test_users_are_limited_separately():
+    throttle = make_throttle()
+    assert [throttle.check(1, f"/c{i}", now=0) for i in range(4)][-1] == THROTTLED
+    assert throttle.check(2, "/c0", now=0) is None
+
+
+def test_duplicate_note_once_per_accepted_command():
+    throttle = make_throttle()
+    throttle.check(1, "/print_list", now=0)
+    assert throttle.note_duplicate(1)
+    assert not throttle.note_duplicate(1)
+    throttle.check(1, "/approve", now=0)
+    assert throttle.note_duplicate(1)
+
+
+def test_warn_once_per_cooldown():
+    throttle = make_throttle()
+    for i in range(4):
+        throttle.check(1, f"/c{i}", now=0)
+    assert throttle.warn(1, now=0) == pytest.approx(1)
+    assert throttle.warn(1, now=0.5) is None
+    assert throttle.warn(1, now=1.5) is not None
+
+
+def test_redelivered_updates_survive_a_restart():
+    throttle = make_throttle()
+    assert not throttle.seen_update(10)
+    assert throttle.seen_update(10)
+    restarted = make_throttle()
+    restarted.restore_updates(throttle.recent_updates(100))
+    assert restarted.seen_update(10)
+    assert not restarted.seen_update(11)
@@ -0,0 +1,122 @@
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Deque, Iterable, List, Optional, Set
+
+from outbox import TokenBucket
+
+DUPLICATE = "duplicate"
+THROTTLED = "throttled"
+
+
+class _UserState:
+    __slots__ = ("bucket", "warned_until", "last_command", "last_accepted", "duplicate_noted")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        # Until when the user has been told to slow down, so they are told once per cooldown
+        self.warned_until = 0.0
+        # Text of the user's last accepted command and when it was accepted
+        self.last_command: Optional[str] = None
+        self.last_accepted = 0.0
+        # Whether the user was told a repeat of their last command was dropped
+        self.duplicate_noted = False
+
+
+class Throttle:
+    """Per-user command rate limits and suppression of repeated commands and updates.
+
+    Only repeats of idempotent commands, e.g. /print_list, are suppressed; a
+    repeated toggle like /bring_ball is meant. Every check is a few dict
+    operations. Memory is bounded: at most `max_users` users are kept, least
+    recently used first out, and the last `max_updates` update IDs are remembered.
+    """
+
+    def __init__(self, rate: float, burst: float, duplicate_window: float, idempotent: Iterable[str] = (),
+                 max_users: int = 10000, max_updates: int = 1000):
+        self.rate = rate
+        self.burst = burst
+        self.duplicate_window = duplicate_window
+        # Command names, e.g. "/print_list", whose repeats change nothing
+        self.idempotent = frozenset(idempotent)
+        self.max_users = max_users
+        self._users: "OrderedDict[int, _UserState]" = OrderedDict()
+        self._update_ids: Deque[int] = deque(maxlen=max_updates)
+        self._update_id_set: Set[int] = set()
+        self.dropped = {DUPLICATE: 0, THROTTLED: 0, "redelivered": 0}
+
+    def seen_update(self, update_id: int) -> bool:
+        """Whether an update was already received; records it if not."""
+        if update_id in self._update_id_set:
+            self.dropped["redelivered"] += 1
+            return True
+        if len(self._update_ids) == self._update_ids.maxlen:
+            self._update_id_set.discard(self._update_ids[0])
+        self._update_ids.append(update_id)
+        self._update_id_set.add(update_id)
+        return False
+
+    def recent_updates(self, limit: int) -> List[int]:
+        """The last `limit` update IDs, oldest first."""
+        return list(islice(reversed(self._update_ids), limit))[::-1]
+
+    def restore_updates(self, update_ids: List[int]) -> None:
+        """Remember the update IDs received before a restart, so redeliveries are dropped.
+
+        Exact IDs rather than a high-water mark: Telegram picks a random next ID
+        after a week without updates.
+        """
+        for update_id in update_ids:
+            if update_id not in self._update_id_set:
+                self.seen_update(update_id)
+
+    def _user(self, user_id: int, now: float) -> _UserState:
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState(TokenBucket(self.rate, self.burst))
+            state.bucket.updated = now
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return state
+
+    def check(self, user_id: int, command: str, now: Optional[float] = None) -> Optional[str]:
+        """Return None if a command may run, DUPLICATE or THROTTLED if it should be dropped.
+
+        An idempotent command identical to the last one the same user had
+        accepted, within `duplicate_window`, is a duplicate and costs no token.
+        """
+        now = time.monotonic() if now is None else now
+        state = self._user(user_id, now)
+        if (command == state.last_command and now - state.last_accepted < self.duplicate_window
+                and command.split()[0].split("@")[0].lower() in self.idempotent):
+            self.dropped[DUPLICATE] += 1
+            return DUPLICATE
+        if state.bucket.wait_time(now):
+            self.dropped[THROTTLED] += 1
+            return THROTTLED
+        state.bucket.take(now)
+        state.last_command, state.last_accepted, state.duplicate_noted = command, now, False
+        return None
+
+    def note_duplicate(self, user_id: int) -> bool:
+        """Whether the user should be told a duplicate was dropped; once per accepted command."""
+        state = self._users.get(user_id)
+        if state is None or state.duplicate_noted:
+            return False
+        state.duplicate_noted = True
+        return True
+
+    def warn(self, user_id: int, now: Optional[float] = None) -> Optional[float]:
+        """Seconds the user should wait, or None if they were already told during this cooldown."""
+        now = time.monotonic() if now is None else now
+        state = self._user(user_id, now)
+        if now < state.warned_until:
+            return None
+        wait = state.bucket.wait_time(now)
+        state.warned_until = now + wait
+        return wait
+
+    def stats(self) -> dict:
+        return {"users": len(self._users), **self.dropped}
@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import hmac
+import json
+import logging
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from typing import Optional
+
+from telegram import Chat, Message, Update
+from telegram._utils.defaultvalue import DefaultValue
+from telegram.ext import Application, ExtBot
+
+from webserver import HTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+# How long the webhook request waits for a handler's first reply to answer inline
+INLINE_REPLY_WAIT = 0.5
+
+
+class InlineReply:
+    __slots__ = ("chat_id", "future")
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.future = asyncio.get_running_loop().create_future()
+
+
+_inline_reply: contextvars.ContextVar[Optional[InlineReply]] = contextvars.ContextVar("inline_reply", default=None)
+
+
+class WebhookBot(ExtBot):
+    """Bot that can hand the first plain reply of an update back as the webhook response.
+
+    Telegram executes a method returned in the webhook response body, which saves
+    a separate API request. Only plain text messages to the private chat the
+    update came from qualify; the returned Message carries no real message_id.
+    """
+
+    async def send_message(self, chat_id, text, *args, **kwargs) -> Message:
+        slot = _inline_reply.get()
+        if slot is not None and not slot.future.done() and chat_id == slot.chat_id and not args and all(
+            value is None or isinstance(value, DefaultValue) for name, value in kwargs.items() if name != "parse_mode"
+        ):
+            payload = {"method": "sendMessage", "chat_id": chat_id, "text": text}
+            parse_mode = kwargs.get("parse_mode")
+            if parse_mode and not isinstance(parse_mode, DefaultValue):
+                payload["parse_mode"] = parse_mode
+            slot.future.set_result(payload)
+            message = Message(message_id=0, date=datetime.now(timezone.utc),
+                              chat=Chat(id=chat_id, type=Chat.PRIVATE), text=text)
+            message.set_bot(self)
+            return message
+        return await super().send_message(chat_id, text, *args, **kwargs)
+
+
+class WebhookReceiver:
+    """Receives updates on `path` of an HTTPServer and feeds them to the application."""
+
+    def __init__(self, application: Application, server: HTTPServer, path: str, secret: str, journal=None):
+        self.application = application
+        # Records updates until their handling starts, see UpdateJournal
+        self.journal = journal
+        self.server = server
+        self.path = path
+        self.secret = secret
+        self._tasks = set()
+        server.route("POST", path, self.handle)
+
+    async def handle(self, request: Request) -> Response:
+        received = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(received.encode(), self.secret.encode()):
+            logger.warning("Rejected webhook request with a wrong secret token")
+            return Response(403, b"forbidden")
+        try:
+            update = Update.de_json(request.json(), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Rejected malformed webhook update: {e}")
+            return Response(400, b"bad update")
+        if update is None:
+            return Response(400, b"empty update")
+        if self.journal is not None:
+            self.journal.record(update)
+
+        chat = update.effective_chat
+        slot = None
+        if chat is not None and chat.type == Chat.PRIVATE:
+            slot = InlineReply(chat.id)
+        # The task copies the context with the slot. Going through the update processor
+        # keeps CONCURRENT_UPDATES and the order of updates the same as with polling
+        token = _inline_reply.set(slot)
+        try:
+            processor = self.application.update_processor
+            task = asyncio.create_task(processor.process_update(update, self.application.process_update(update)))
+        finally:
+            _inline_reply.reset(token)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        if slot is None:
+            return Response(200, b"")
+        try:
+            await asyncio.wait({slot.future, task}, timeout=INLINE_REPLY_WAIT, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not slot.future.done():
+                # Too late to answer inline, later replies go through the API
+                slot.future.cancel()
+        if slot.future.cancelled():
+            return Response(200, b"")
+        return Response.json(slot.future.result())
+
+    async def start(self, url: str, allowed_updates, drop_pending_updates: bool = True) -> None:
+        await self.server.start()
+        await self.application.bot.set_webhook(
+            url=url.rstrip("/") + self.path,
+            secret_token=self.secret,
+            allowed_updates=allowed_updates,
+            drop_pending_updates=drop_pending_updates,
+        )
+        logger.info(f"Webhook set to {url.rstrip('/')}{self.path}")
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop receiving and wait at most `timeout` seconds for the updates being handled."""
+        await self.server.stop(timeout)
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"Cancelled {len(pending)} webhook updates still being handled at shutdown")
+
+
+def post_fake_update(url: str, secret: str, text: str, user_id: int = 1000, username: str = "tester") -> None:
+    """Post a private-chat command to a local webhook and print the answer and round-trip time."""
+    update = {
+        "update_id": int(time.time() * 1000) % 2_000_000_000,
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": username, "username": username},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }
+    request = urllib.request.Request(
+        url, data=json.dumps(update).encode(), method="POST",
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+    )
+    started = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        body = response.read().decode()
+    print(f"{response.status} in {(time.perf_counter() - started) * 1000:.1f} ms: {body or '(no inline answer)'}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage: python webhook.py <webhook url> <secret> <command> [user id]")
+        sys.exit(1)
+    post_fake_update(sys.argv[1], sys.argv[2], sys.argv[3], *(int(arg) for arg in sys.argv[4:5]))
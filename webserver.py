@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 1024 * 1024
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method: str, path: str, query: Dict[str, list], headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+
+class Response:
+    __slots__ = ("status", "body", "content_type")
+
+    def __init__(self, status: int = 200, body: bytes = b"", content_type: str = "text/plain; charset=utf-8"):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+
+    @classmethod
+    def json(cls, data, status: int = 200) -> "Response":
+        return cls(status, json.dumps(data).encode(), "application/json")
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HTTPServer:
+    """Minimal HTTP/1.1 server on asyncio streams with keep-alive support.
+
+    Enough for the Telegram webhook and local endpoints without adding a web
+    framework to the dependencies.
+    """
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 8080):
+        self.host = host
+        self.port = port
+        self.routes: Dict[Tuple[str, str], Handler] = {}
+        self._server = None
+        # Open connections by the task serving them, and those in the middle of a request
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._busy: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        self.routes[(method.upper(), path)] = handler
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        if self.port == 0:
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self, timeout: Optional[float] = 5) -> None:
+        """Stop listening, close idle connections and wait at most `timeout` seconds for requests being handled."""
+        if self._server is None:
+            return
+        self._stopping = True
+        self._server.close()
+        for task, writer in list(self._connections.items()):
+            if task not in self._busy:
+                writer.close()
+        if self._connections:
+            _, pending = await asyncio.wait(set(self._connections), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+                logger.warning(f"Cancelled {len(pending)} HTTP requests still being handled at shutdown")
+        await self._server.wait_closed()
+        self._server = None
+        self._stopping = False
+        logger.info("HTTP server stopped")
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while not self._stopping:
+                request, keep_alive = await self._read_request(reader)
+                if request is None:
+                    break
+                self._busy.add(task)
+                try:
+                    response = await self._dispatch(request)
+                finally:
+                    self._busy.discard(task)
+                keep_alive = keep_alive and not self._stopping
+                self._write_response(writer, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Only stop() cancels a connection; asyncio would log a traceback for a cancelled one
+            pass
+        except ValueError as e:
+            logger.warning(f"Malformed HTTP request: {e}")
+            self._write_response(writer, Response(400, b"bad request"), False)
+        finally:
+            writer.close()
+            self._connections.pop(task, None)
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[Optional[Request], bool]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None, False
+        method, target, version = request_line.decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY_SIZE:
+            raise ValueError(f"body of {length} bytes is too large")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        return Request(method.upper(), url.path, parse_qs(url.query), headers, body), keep_alive
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                return Response(405, b"method not allowed")
+            return Response(404, b"not found")
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"Error handling {request.method} {request.path}: {e}")
+            return Response(500, b"internal error")
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, response: Response, keep_alive: bool) -> None:
+        head = (
+            f"HTTP/1.1 {response.status} {REASONS.get(response.status, 'Unknown')}\r\n"
+            f"Content-Type: {response.content_type}\r\n"
+            f"Content-Length: {len(response.body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + response.body)